@@ -1,375 +1,125 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
-from fpdf import FPDF
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
 import io
 import re
-import tempfile
 import os
-import pytz
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
 import math
 import random
-import json
 import time
 import base64
+import functools
+import backup
+import db
+import doc_cache
+import exports
+import instrument
+import mailer
+import orders
+from db import load_catalog, upsert_catalog_from_df, clear_catalog, get_revision, save_setting, get_setting, clear_signature, list_batches, get_batch, get_batch_lines, update_batch, complete_batch, history_page, history_summary, history_monthly_totals, history_buyers
+from exports import DEF_CONS_NAME, DEF_CONS_ADDR, DEF_CONS_CITY, DEF_CONS_STATE, DEF_CONS_ZIP, DEF_CONS_OTHER, DEFAULT_HTS, DEFAULT_FDA, create_batch
 
 # --- GLOBAL DEFAULTS ---
-DEFAULT_SHIPPER = """Holistic Roasters inc.
-3780 St-Patrick
-Montreal, QC, Canada H4E 1A2
-BN/GST: 780810917RC0001
-TVQ: 1225279701TQ0001"""
+ARCHIVE_PAGE_SIZE = 50
 
-DEF_CONS_NAME = "Border Mail Depot"
-DEF_CONS_ADDR = "102 W. Service Road"
-DEF_CONS_CITY = "Champlain"
-DEF_CONS_STATE = "NY"
-DEF_CONS_ZIP = "12919"
-DEF_CONS_OTHER = "IRS# 461729644"
-DEFAULT_CONSIGNEE_FULL = "Border Mail Depot\n102 W. Service Road\nChamplain, NY 12919\nIRS# 461729644\nUnited States"
+# --- Database ---
+@st.cache_resource(show_spinner=False)
+def open_database():
+    # The process-wide connection (WAL, migrations applied once); shared by every session
+    return db.Database(db.DB_PATH)
 
-DEFAULT_IMPORTER = """Holistic Roasters USA
-30 N Gould St, STE R
-Sheridan, WY 82801
-IRS/EIN: 32-082713200"""
+db.set_provider(open_database)
+mailer.start_worker()  # delivers queued Email Center messages in the background
 
-DEFAULT_NOTES = """CUSTOMS BROKER: Strix (Entry@strixsmart.com)
-HOLISTIC ROASTERS inc. Canada FDA #: 11638755492
-- ALL PRICES IN USD
-- Incoterms: EXW"""
-
-DEFAULT_HTS = "0901.21.00.20"
-DEFAULT_FDA = "31ADT01"
-
-# --- Database Setup ---
-def init_db():
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS invoice_history_v3
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  invoice_number TEXT,
-                  date_created TEXT,
-                  total_value REAL,
-                  buyer_name TEXT)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS product_catalog_v3
-                 (sku TEXT PRIMARY KEY,
-                  product_name TEXT,
-                  description TEXT,
-                  hts_code TEXT,
-                  fda_code TEXT,
-                  weight_lbs REAL,
-                  unit_price REAL,
-                  country_of_origin TEXT,
-                  product_id TEXT)''')
-    
-    # MIGRATIONS
-    try: c.execute("ALTER TABLE product_catalog_v3 ADD COLUMN unit_price REAL")
-    except: pass 
-    try: c.execute("ALTER TABLE product_catalog_v3 ADD COLUMN country_of_origin TEXT")
-    except: pass
-    try: c.execute("ALTER TABLE product_catalog_v3 ADD COLUMN product_id TEXT")
-    except: pass
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS settings
-                 (key TEXT PRIMARY KEY,
-                  value BLOB)''')
-    
-    c.execute('''CREATE TABLE IF NOT EXISTS batches
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  batch_name TEXT,
-                  status TEXT,
-                  created_at TEXT,
-                  updated_at TEXT,
-                  data TEXT)''')
-    conn.commit()
-    conn.close()
-
-# --- DB Functions ---
-def clean_sku(val):
-    if pd.isna(val) or val == "": return ""
-    val_str = str(val).strip()
-    if val_str.endswith(".0"): return val_str[:-2]
-    return val_str
-
-def get_catalog():
-    conn = sqlite3.connect('invoices.db')
-    df = pd.read_sql_query("SELECT * FROM product_catalog_v3", conn)
-    conn.close()
-    return df
-
-def upsert_catalog_from_df(df):
-    df.columns = df.columns.str.strip().str.lower()
-    col_map = {
-        'price': 'unit_price', 'cost': 'unit_price', 'unit price': 'unit_price',
-        'origin': 'country_of_origin', 'country': 'country_of_origin', 'coo': 'country_of_origin', 'country of origin': 'country_of_origin',
-        'weight': 'weight_lbs', 'lbs': 'weight_lbs', 'weight (lbs)': 'weight_lbs',
-        'sku': 'sku', 'variant code': 'sku', 'variant code / sku': 'sku',
-        'product': 'product_name', 'name': 'product_name', 'item variant': 'product_name',
-        'desc': 'description', 'description': 'description',
-        'hts': 'hts_code', 'hs code': 'hts_code', 'hts code': 'hts_code',
-        'fda': 'fda_code', 'fda code': 'fda_code',
-        'product id': 'product_id', 'id': 'product_id', 'prod id': 'product_id', 'master sku': 'product_id'
-    }
-    renamed_cols = {}
-    for col in df.columns:
-        if col in col_map: renamed_cols[col] = col_map[col]
-    df.rename(columns=renamed_cols, inplace=True)
-
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    for _, row in df.iterrows():
-        p_name = row.get('product_name', '')
-        desc = row.get('description', '')
-        weight = row.get('weight_lbs', 0.0)
-        price = row.get('unit_price', 0.0)
-        origin = row.get('country_of_origin', 'CA')
-        prod_id = row.get('product_id', '')
-
-        if pd.isna(origin) or origin == "": origin = "CA"
-        try: weight = float(weight)
-        except: weight = 0.0
-        try: price = float(price)
-        except: price = 0.0
-        if pd.isna(desc) or desc == "": desc = p_name
-        
-        sku_val = clean_sku(row.get('sku', ''))
-        
-        if pd.isna(prod_id) or str(prod_id).strip() == "":
-            prod_id = sku_val
-
-        if sku_val:
-            c.execute("""INSERT OR REPLACE INTO product_catalog_v3 
-                         (sku, product_name, description, hts_code, fda_code, weight_lbs, unit_price, country_of_origin, product_id) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                      (sku_val, p_name, desc, str(row.get('hts_code', '')), str(row.get('fda_code', '')), weight, price, str(origin), str(prod_id)))
-    conn.commit()
-    conn.close()
-
-def clear_catalog():
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM product_catalog_v3")
-    conn.commit()
-    conn.close()
-
-def save_setting(key, value_bytes):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value_bytes))
-    conn.commit()
-    conn.close()
-
-def get_setting(key):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key=?", (key,))
-    data = c.fetchone()
-    conn.close()
-    return data[0] if data else None
-
-def get_signature():
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_signature(db_generation, settings_revision):
+    # One shared bytes object per database generation and settings revision, so the decoded image (documents.signature_image) is reused too
     return get_setting('signature')
 
-def clear_signature():
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM settings WHERE key='signature'")
-    conn.commit()
-    conn.close()
-
-# --- BATCH FUNCTIONS ---
-def get_batches(status='Active'):
-    conn = sqlite3.connect('invoices.db')
-    df = pd.read_sql_query("SELECT * FROM batches WHERE status=? ORDER BY updated_at DESC", conn, params=(status,))
-    conn.close()
-    return df
-
-def create_batch(name):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    est = pytz.timezone('US/Eastern')
-    now = datetime.now(est).strftime("%Y-%m-%d %H:%M:%S")
-    
-    saved_cons = get_setting('default_consignee')
-    def_cons = saved_cons.decode('utf-8') if saved_cons else DEFAULT_CONSIGNEE_FULL
-    saved_notes = get_setting('default_notes')
-    def_notes = saved_notes.decode('utf-8') if saved_notes else DEFAULT_NOTES
-    saved_carrier = get_setting('default_carrier')
-    def_carrier = saved_carrier.decode('utf-8') if saved_carrier else "GCYD (Green City Courier)"
-
-    new_data = {
-        "inv_number": f"{date.today().strftime('%Y%m%d')}1",
-        "inv_date": str(date.today()),
-        "discount": 75.0,
-        "cons_name": DEF_CONS_NAME,
-        "cons_addr": DEF_CONS_ADDR,
-        "cons_city": DEF_CONS_CITY,
-        "cons_state": DEF_CONS_STATE,
-        "cons_zip": DEF_CONS_ZIP,
-        "cons_other": DEF_CONS_OTHER,
-        "notes": def_notes,
-        "carrier": def_carrier,
-        "pallets": 1,
-        "cartons": 1,
-        "gross_weight": 0.0,
-        "orders_json": None
-    }
-
-    try:
-        c.execute("SELECT data FROM batches ORDER BY updated_at DESC LIMIT 1")
-        row = c.fetchone()
-        if row:
-            last_data = json.loads(row[0])
-            if 'cons_name' in last_data: new_data['cons_name'] = last_data['cons_name']
-            if 'cons_addr' in last_data: new_data['cons_addr'] = last_data['cons_addr']
-            if 'cons_city' in last_data: new_data['cons_city'] = last_data['cons_city']
-            if 'cons_state' in last_data: new_data['cons_state'] = last_data['cons_state']
-            if 'cons_zip' in last_data: new_data['cons_zip'] = last_data['cons_zip']
-            if 'cons_other' in last_data: new_data['cons_other'] = last_data['cons_other']
-            
-            if 'notes' in last_data and last_data['notes']: new_data['notes'] = last_data['notes']
-            if 'carrier' in last_data: new_data['carrier'] = last_data['carrier']
-            if 'gross_weight' in last_data: new_data['gross_weight'] = last_data['gross_weight']
-            if 'pallets' in last_data: new_data['pallets'] = last_data['pallets']
-    except Exception as e:
-        print(f"Inheritance error: {e}")
-    
-    c.execute("INSERT INTO batches (batch_name, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
-              (name, 'Active', now, now, json.dumps(new_data)))
-    new_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return new_id
-
-def update_batch(batch_id, data_dict):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    est = pytz.timezone('US/Eastern')
-    now = datetime.now(est).strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("UPDATE batches SET data=?, updated_at=? WHERE id=?", 
-              (json.dumps(data_dict), now, batch_id))
-    conn.commit()
-    conn.close()
-
-def finalize_batch_in_db(batch_id):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    c.execute("UPDATE batches SET status='Completed' WHERE id=?", (batch_id,))
-    conn.commit()
-    conn.close()
-
-def save_invoice_metadata(inv_num, total_val, buyer):
-    conn = sqlite3.connect('invoices.db')
-    c = conn.cursor()
-    est = pytz.timezone('US/Eastern')
-    timestamp = datetime.now(est).strftime("%Y-%m-%d %H:%M EST")
-    c.execute("""INSERT INTO invoice_history_v3 
-                 (invoice_number, date_created, total_value, buyer_name) 
-                 VALUES (?, ?, ?, ?)""",
-              (inv_num, timestamp, total_val, buyer))
-    conn.commit()
-    conn.close()
-
-def get_history():
-    conn = sqlite3.connect('invoices.db')
-    df = pd.read_sql_query("SELECT invoice_number, date_created, buyer_name, total_value FROM invoice_history_v3 ORDER BY id DESC", conn)
-    conn.close()
-    return df
+def get_signature():
+    with instrument.span("app.get_signature"):
+        return load_signature(db.get_db().generation, get_revision('settings'))
+
+def show_perf_panel():
+    with st.sidebar.expander("⏱️ Performance"):
+        if not st.checkbox("Record timings", key="perf_enabled"): return
+        rec = st.session_state.get('perf_recorder')
+        if rec is None or rec.run_seconds is None: st.caption("Recording starts with the next rerun."); return
+        st.caption(f"Last rerun: {rec.run_seconds * 1000:,.0f} ms, {len(rec.spans)} spans")
+        if rec.spans:
+            st.dataframe(pd.DataFrame({"span": ["· " * depth + name for name, start, dur, depth, attrs in rec.spans],
+                                       "ms": [round(dur * 1000, 1) for name, start, dur, depth, attrs in rec.spans]}),
+                         hide_index=True, use_container_width=True)
+        st.caption(f"Totals over {rec.reruns} reruns")
+        totals = pd.DataFrame([(name, c, t * 1000, t * 1000 / c, m * 1000) for name, (c, t, m) in rec.totals.items()],
+                              columns=["span", "calls", "total ms", "mean ms", "max ms"]).sort_values("total ms", ascending=False)
+        st.dataframe(totals.round(1), hide_index=True, use_container_width=True)
+        b1, b2 = st.columns(2)
+        with b1: st.button("Profile next rerun", on_click=lambda: setattr(rec, 'profile_next', True), help="cProfile of one whole rerun")
+        with b2: st.button("Reset totals", on_click=rec.reset)
+        st.download_button("Export spans (JSON)", rec.to_json, "spans.json", mime="application/json")
+        if rec.profile_stats:
+            st.download_button("Download profile (.prof)", rec.profile_dump, "rerun.prof", mime="application/octet-stream")
+            st.code(rec.profile_stats, language=None)
+
+@functools.cache
+def theme_css():
+    # assets/theme.css, read once per process; no web fonts are fetched
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "theme.css"), encoding="utf-8") as f:
+        return f"<style>{f.read()}</style>"
 
 def show_backup_prompt(key_suffix):
-    if os.path.exists("invoices.db"):
-        st.info("✅ **Changes Saved to Database!**")
-        with open("invoices.db", "rb") as f:
-            st.download_button(
-                "📥 DOWNLOAD BACKUP NOW",
-                data=f,
-                file_name=f"holistic_backup_{datetime.now().strftime('%Y-%m-%d_%H%M')}.db",
-                mime="application/x-sqlite3",
-                key=f"prompt_backup_{key_suffix}",
-                type="primary"
-            )
-
-def send_email_with_attachments(sender_email, sender_password, recipient_email, subject, body, files):
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-    for f in files:
-        part = MIMEApplication(f['data'], Name=f['name'])
-        part['Content-Disposition'] = f'attachment; filename="{f["name"]}"'
-        msg.attach(part)
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, recipient_email, msg.as_string())
-        server.quit()
-        return True, "Email sent successfully!"
-    except Exception as e:
-        return False, str(e)
-
-init_db()
+    st.info("✅ **Changes Saved to Database!**")
+    st.download_button(
+        "📥 DOWNLOAD BACKUP NOW",
+        data=backup.compressed_snapshot,  # built only when clicked
+        file_name=backup.backup_filename(),
+        mime="application/gzip",
+        key=f"prompt_backup_{key_suffix}",
+        type="primary"
+    )
 
 st.set_page_config(page_title="Holistic Roasters Export Hub", layout="wide")
 
-st.markdown("""
-    <style>
-        @import url('https://fonts.googleapis.com/css2?family=Montserrat:wght@400;600;700&family=Open+Sans:wght@400;600&display=swap');
-        .stApp { background-color: #FAFAFA; font-family: 'Open Sans', sans-serif; }
-        h1, h2, h3 { font-family: 'Montserrat', sans-serif !important; color: #6F4E37 !important; font-weight: 700; }
-        div.stButton > button { background-color: #6F4E37 !important; color: white !important; border-radius: 8px !important; border: none !important; font-family: 'Montserrat', sans-serif !important; font-weight: 600 !important; }
-        div.stButton > button:hover { background-color: #5A3E2B !important; }
-        .stTextInput input, .stTextArea textarea, .stDateInput input, .stNumberInput input { border-radius: 8px !important; border: 1px solid #D0D0D0 !important; }
-        .stTextInput input:focus, .stTextArea textarea:focus { border-color: #6F4E37 !important; box-shadow: 0 0 0 1px #6F4E37 !important; }
-        [data-testid="stSidebar"] { background-color: #f0f2f6; }
-    </style>
-""", unsafe_allow_html=True)
+# Per-session timing spans, opt-in from the sidebar's Performance panel (drawn at the end of the script)
+instrument.begin(st.session_state.setdefault('perf_recorder', instrument.Recorder()) if st.session_state.get('perf_enabled') else None)
+
+st.markdown(theme_css(), unsafe_allow_html=True)
 
 # --- BACKUP SIDEBAR ---
 st.sidebar.header("☁️ Team Database Sync")
 
 # Keep your cool timestamp feature!
-if os.path.exists("invoices.db"):
-    mod_time = os.path.getmtime("invoices.db")
-    dt_mod = datetime.fromtimestamp(mod_time).strftime('%I:%M:%S %p')
-    st.sidebar.caption(f"Last Saved: {dt_mod}")
+saved_at = backup.last_saved()
+if saved_at:
+    st.sidebar.caption(f"Last Saved: {saved_at.strftime('%I:%M:%S %p')}")
 
 # --- RESTORE SECTION ---
 st.sidebar.subheader("1. Download & Restore")
 st.sidebar.markdown("[📁 Open Shared Drive](https://drive.google.com/drive/folders/1esZ27LoOPerYX-jo7d_7aIdke7DJxpZO?usp=drive_link)")
-uploaded_db = st.sidebar.file_uploader("Upload Drive backup here:", type=["db", "sqlite"])
+uploaded_db = st.sidebar.file_uploader("Upload Drive backup here:", type=["gz", "db", "sqlite"])
 
 if uploaded_db:
     if st.sidebar.button("⚠️ Confirm Restore"):
         try:
-            with open("invoices.db", "wb") as f: 
-                f.write(uploaded_db.getvalue())
-            st.sidebar.success("✅ Restored! Reloading page...")
-            time.sleep(1)
+            with st.sidebar:
+                with st.spinner("Checking and restoring backup..."): backup.restore(uploaded_db)
+            st.toast("✅ Database restored!")
             st.rerun()
-        except Exception as e: 
-            st.sidebar.error(f"Error: {e}")
+        except backup.RestoreError as e:
+            st.sidebar.error(f"Restore failed, nothing was changed: {e}")
 
 st.sidebar.divider()
 
 # --- BACKUP SECTION ---
 st.sidebar.subheader("2. Save & Upload")
-if os.path.exists("invoices.db"):
-    with open("invoices.db", "rb") as f:
-        st.sidebar.download_button(
-            label="📥 Step 1: Download File", 
-            data=f, 
-            file_name=f"holistic_backup_{datetime.now().strftime('%Y-%m-%d_%H%M')}.db", 
-            mime="application/x-sqlite3", 
-            key="sidebar_backup"
-        )
+st.sidebar.download_button(
+    label="📥 Step 1: Download File",
+    data=backup.compressed_snapshot,  # built only when clicked
+    file_name=backup.backup_filename(),
+    mime="application/gzip",
+    key="sidebar_backup"
+)
 st.sidebar.markdown("[📁 Step 2: Drag into Drive](https://drive.google.com/drive/folders/1esZ27LoOPerYX-jo7d_7aIdke7DJxpZO?usp=drive_link)")
 
 st.sidebar.markdown("---")
@@ -379,354 +129,6 @@ st.title("☕ Holistic Roasters Export Hub")
 st.sidebar.header("📁 Workflow")
 page = st.sidebar.radio("Go to:", ["Batches (Dashboard)", "Catalog", "Archive (History)"])
 
-# --- PDF Class ---
-class ProInvoice(FPDF):
-    def header(self): pass
-    def footer(self):
-        self.set_y(-15); self.set_font('Helvetica', 'I', 8); self.cell(0, 10, f'Page {self.page_no()} of {{nb}}', 0, 0, 'R')
-
-# --- PDF DRAW FUNCTIONS ---
-
-def draw_ci_page(pdf, doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=False)
-    pdf.set_font('Helvetica', 'B', 20); pdf.cell(0, 10, doc_type, 0, 1, 'C'); pdf.ln(5)
-    
-    # Header
-    pdf.set_font("Helvetica", '', 9); y_start = pdf.get_y()
-    pdf.set_xy(10, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIPPER / EXPORTER:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_from)
-    pdf.set_xy(90, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "CONSIGNEE (SHIP TO):", 0, 1); pdf.set_xy(90, pdf.get_y()); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_ship)
-    pdf.set_xy(160, y_start); pdf.set_font("Helvetica", 'B', 12); pdf.cell(40, 6, f"Invoice #: {inv_num}", 0, 1, 'R'); pdf.set_x(160); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, f"Date: {inv_date}", 0, 1, 'R'); pdf.set_x(160); pdf.cell(40, 6, "Currency: USD", 0, 1, 'R')
-    y_mid = max(pdf.get_y(), 60) + 10; pdf.set_xy(10, y_mid); pdf.set_font("Helvetica", 'B', 10); pdf.cell(80, 5, "IMPORTER OF RECORD:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(80, 4, addr_to)
-    pdf.set_xy(100, y_mid); pdf.set_fill_color(245, 245, 245); pdf.rect(100, y_mid, 95, 30, 'F')
-    pdf.set_xy(102, y_mid + 2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(50, 5, "NOTES / BROKER / FDA:", 0, 1); pdf.set_xy(102, pdf.get_y()); pdf.set_font("Helvetica", '', 8); pdf.multi_cell(90, 4, notes); pdf.set_y(y_mid + 35)
-    
-    # Table
-    w = [10, 65, 22, 20, 12, 18, 18, 25] 
-    headers = ["QTY", "DESCRIPTION", "HTS #", "FDA", "ORIGIN", "UNIT WT", "UNIT ($)", "TOTAL ($)"]
-    pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-    pdf.ln(); pdf.set_font("Helvetica", '', 7)
-    
-    def get_lines(text, width):
-        if not text: return 1
-        lines = 0
-        for para in str(text).split('\n'):
-            if not para: lines += 1; continue
-            words = para.split(' '); curr_w = 0; lines_para = 1
-            for word in words:
-                word_w = pdf.get_string_width(word + " ")
-                if curr_w + word_w > width: lines_para += 1; curr_w = word_w
-                else: curr_w += word_w
-            lines += lines_para
-        return lines
-
-    line_h = 5
-    for _, row in df.iterrows():
-        origin = str(row.get('country_of_origin', 'CA'))
-        desc = str(row['Description'])
-        d_row = [(str(int(row['Quantity'])), 'C'), (desc, 'L'), (str(row.get('HTS Code','')), 'C'), (str(row.get('FDA Code','')), 'C'), (origin, 'C'), (f"{row.get('Weight (lbs)', 0):.2f} lbs", 'C'), (f"{row['Transfer Price (Unit)']:.2f}", 'R'), (f"{row['Transfer Total']:.2f}", 'R')]
-        max_lines = 1
-        for i, (txt, align) in enumerate(d_row):
-            lines = get_lines(txt, w[i] - 2)
-            if lines > max_lines: max_lines = lines
-        row_h = max_lines * line_h
-        if pdf.get_y() + row_h > 270:
-            pdf.add_page(); pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-            for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-            pdf.ln(); pdf.set_font("Helvetica", '', 7)
-        y_curr = pdf.get_y(); x_curr = 10
-        for i, (txt, align) in enumerate(d_row):
-            pdf.set_xy(x_curr + sum(w[:i]), y_curr); pdf.multi_cell(w[i], line_h, txt, 0, align)
-        pdf.set_xy(10, y_curr)
-        for i in range(len(w)): pdf.rect(10 + sum(w[:i]), y_curr, w[i], row_h)
-        pdf.set_y(y_curr + row_h)
-
-    pdf.ln(2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(sum(w[:-1]), 8, "TOTAL VALUE (USD):", 0, 0, 'R'); pdf.cell(w[-1], 8, f"${total_val:,.2f}", 1, 1, 'R')
-    
-    pdf.ln(10)
-    pdf.set_font("Helvetica", '', 10)
-    pdf.cell(0, 5, "I declare that all information contained in this invoice to be true and correct.", 0, 1, 'L')
-    
-    pdf.ln(25) # Increased gap for signature
-    y_sig_line = pdf.get_y()
-    
-    pdf.set_font("Helvetica", 'B', 10)
-    pdf.cell(0, 5, signer_name, 0, 1, 'L')
-    
-    if sig_bytes:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp: tmp.write(sig_bytes); tmp_path = tmp.name
-        try: 
-            pdf.image(tmp_path, x=10, y=y_sig_line - 20, w=40) 
-        except: pass
-        os.unlink(tmp_path)
-
-def draw_bol_page(pdf, df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes):
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=False)
-    pdf.set_font('Helvetica', 'B', 18); pdf.cell(0, 10, "STRAIGHT BILL OF LADING", 0, 1, 'C'); pdf.ln(5)
-    pdf.set_font("Helvetica", '', 10); y_top = pdf.get_y()
-    pdf.set_xy(10, y_top); pdf.set_font("Helvetica", 'B', 10); pdf.cell(20, 6, "Date:", 0, 0); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, str(inv_date), 0, 0)
-    pdf.set_xy(130, y_top); pdf.set_font("Helvetica", 'B', 10); pdf.cell(30, 6, "BOL #:", 0, 0, 'R'); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, hbol_number, 0, 1, 'R'); pdf.ln(10)
-    y_addr = pdf.get_y()
-    pdf.set_xy(10, y_addr); pdf.set_font("Helvetica", 'B', 11); pdf.cell(90, 6, "SHIP FROM (SHIPPER)", 1, 1, 'L', fill=False); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(0, 5, shipper_txt, 1, 'L'); pdf.ln(5)
-    pdf.set_x(10); pdf.set_font("Helvetica", 'B', 11); pdf.cell(0, 6, "SHIP TO (CONSIGNEE)", 1, 1, 'L', fill=False); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(0, 5, consignee_txt, 1, 'L'); pdf.ln(5)
-    pdf.set_font("Helvetica", 'B', 11); pdf.cell(0, 6, f"CARRIER: {carrier_pdf_display}", 0, 1); pdf.ln(5)
-    w = [15, 25, 100, 30, 20]; headers = ["HM", "QTY", "DESCRIPTION OF COMMODITY", "WEIGHT", "CLASS"]
-    pdf.set_font("Helvetica", 'B', 9); pdf.set_fill_color(220, 220, 220)
-    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-    pdf.ln()
-    pdf.set_font("Helvetica", '', 9)
-    
-    def print_grid_row(data_list):
-        def get_lines(text, width):
-            if not text: return 1
-            lines = 0; 
-            for para in str(text).split('\n'):
-                if not para: lines += 1; continue
-                words = para.split(' '); curr_w = 0; lines_para = 1
-                for word in words:
-                    word_w = pdf.get_string_width(word + " ")
-                    if curr_w + word_w > width: lines_para += 1; curr_w = word_w
-                    else: curr_w += word_w
-                lines += lines_para
-            return lines
-        line_h = 5; max_lines = 1
-        for i, (txt, align) in enumerate(data_list):
-            lines = get_lines(txt, w[i] - 2)
-            if lines > max_lines: max_lines = lines
-        row_h = max_lines * line_h
-        y_start = pdf.get_y(); x_start = 10
-        for i, (txt, align) in enumerate(data_list):
-            current_x = x_start + sum(w[:i])
-            pdf.set_xy(current_x, y_start); pdf.multi_cell(w[i], line_h, txt, 0, align)
-        pdf.set_xy(x_start, y_start)
-        for i in range(len(w)): pdf.rect(x_start + sum(w[:i]), y_start, w[i], row_h)
-        pdf.set_xy(x_start, y_start + row_h)
-
-    row1 = [("", 'C'), (f"{pallets} PLT", 'C'), ("ROASTED COFFEE (NMFC 056820)", 'L'), (f"{total_weight_lbs:.1f} lbs", 'R'), ("60", 'C')]
-    print_grid_row(row1)
-    row2 = [("", 'C'), (f"{cartons} CTN", 'C'), ("(Contains roasted coffee in bags)", 'L'), ("", 'R'), ("", 'C')]
-    print_grid_row(row2)
-    pdf.ln(10)
-    pdf.set_font("Helvetica", '', 8); legal = "RECEIVED, subject to the classifications and tariffs..."; pdf.multi_cell(0, 4, legal); pdf.ln(15)
-    y_sig = pdf.get_y(); pdf.line(10, y_sig, 90, y_sig); pdf.line(110, y_sig, 190, y_sig)
-    pdf.set_font("Helvetica", 'B', 8); pdf.set_xy(10, y_sig + 2); pdf.cell(80, 4, "SHIPPER SIGNATURE / DATE", 0, 0)
-    pdf.set_xy(110, y_sig + 2); pdf.cell(80, 4, "CARRIER SIGNATURE / DATE", 0, 1)
-    if sig_bytes:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmp: tmp.write(sig_bytes); tmp_path = tmp.name
-        try: pdf.image(tmp_path, x=15, y=y_sig-15, w=35)
-        except: pass
-        os.unlink(tmp_path)
-
-# --- INDIVIDUAL GENERATORS (WRAPPERS) ---
-def generate_ci_pdf(doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
-    pdf = ProInvoice(); pdf.alias_nb_pages()
-    draw_ci_page(pdf, doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name)
-    return bytes(pdf.output())
-
-def generate_bol_pdf(df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes):
-    pdf = FPDF(); pdf.alias_nb_pages()
-    for _ in range(2):
-        draw_bol_page(pdf, df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes)
-    return bytes(pdf.output())
-
-# --- MASTER GENERATOR ---
-def generate_master_print_file(df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name, carrier_name, hbol, pallets, cartons, gross_weight):
-    pdf = ProInvoice(); pdf.alias_nb_pages()
-    
-    # 3 COPIES OF COMMERCIAL INVOICE
-    for _ in range(3):
-        draw_ci_page(pdf, "COMMERCIAL INVOICE", df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name)
-    
-    # 2 COPIES OF BILL OF LADING
-    for _ in range(2):
-        draw_bol_page(pdf, df, inv_num, inv_date, addr_from, addr_ship, carrier_name, hbol, pallets, cartons, gross_weight, sig_bytes)
-        
-    return bytes(pdf.output())
-
-# ... (Previous PO, SI, PL Generators logic unchanged for brevity) ...
-
-def generate_po_pdf(df, inv_num, inv_date, addr_buyer, addr_vendor, addr_ship, total_val):
-    pdf = ProInvoice(); pdf.alias_nb_pages(); pdf.add_page(); pdf.set_auto_page_break(auto=False)
-    pdf.set_font('Helvetica', 'B', 20); pdf.cell(0, 10, "PURCHASE ORDER", 0, 1, 'C'); pdf.ln(5)
-    pdf.set_font("Helvetica", '', 9); y_start = pdf.get_y()
-    pdf.set_xy(10, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "FROM (BUYER):", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_buyer)
-    pdf.set_xy(90, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIP TO:", 0, 1); pdf.set_xy(90, pdf.get_y()); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_ship)
-    pdf.set_xy(160, y_start); pdf.set_font("Helvetica", 'B', 12); pdf.cell(40, 6, f"Invoice #: {inv_num}", 0, 1, 'R'); pdf.set_x(160); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, f"Date: {inv_date}", 0, 1, 'R'); pdf.set_x(160); pdf.cell(40, 6, "Currency: USD", 0, 1, 'R')
-    y_mid = max(pdf.get_y(), 50) + 10; pdf.set_xy(10, y_mid); pdf.set_font("Helvetica", 'B', 10); pdf.cell(80, 5, "TO (VENDOR):", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(80, 4, addr_vendor); pdf.set_y(y_mid + 35)
-    w = [20, 100, 35, 35]; headers = ["QTY", "PRODUCT", "UNIT ($)", "TOTAL ($)"]
-    pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-    pdf.ln(); pdf.set_font("Helvetica", '', 7)
-    
-    def get_lines(text, width):
-        if not text: return 1
-        lines = 0; 
-        for para in str(text).split('\n'):
-            if not para: lines += 1; continue
-            words = para.split(' '); curr_w = 0; lines_para = 1
-            for word in words:
-                word_w = pdf.get_string_width(word + " ")
-                if curr_w + word_w > width: lines_para += 1; curr_w = word_w
-                else: curr_w += word_w
-            lines += lines_para
-        return lines
-
-    line_h = 5
-    for _, row in df.iterrows():
-        d_row = [(str(int(row['Quantity'])), 'C'), (str(row['Description']), 'L'), (f"{row['Transfer Price (Unit)']:.2f}", 'R'), (f"{row['Transfer Total']:.2f}", 'R')]
-        max_lines = 1
-        for i, (txt, align) in enumerate(d_row):
-            lines = get_lines(txt, w[i] - 2)
-            if lines > max_lines: max_lines = lines
-        row_h = max_lines * line_h
-        
-        if pdf.get_y() + row_h > 270:
-            pdf.add_page(); pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-            for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-            pdf.ln(); pdf.set_font("Helvetica", '', 7)
-            
-        y_curr = pdf.get_y(); x_curr = 10
-        for i, (txt, align) in enumerate(d_row):
-            pdf.set_xy(x_curr + sum(w[:i]), y_curr)
-            pdf.multi_cell(w[i], line_h, txt, 0, align)
-        pdf.set_xy(10, y_curr)
-        for i in range(len(w)): pdf.rect(10 + sum(w[:i]), y_curr, w[i], row_h)
-        pdf.set_y(y_curr + row_h)
-
-    pdf.ln(2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(sum(w[:-1]), 8, "TOTAL (USD):", 0, 0, 'R'); pdf.cell(w[-1], 8, f"${total_val:,.2f}", 1, 1, 'R')
-    return bytes(pdf.output())
-
-def generate_pl_pdf(df, inv_num, inv_date, addr_from, addr_to, addr_ship, cartons):
-    pdf = ProInvoice(); pdf.alias_nb_pages(); pdf.add_page(); pdf.set_auto_page_break(auto=False)
-    pdf.set_font('Helvetica', 'B', 20); pdf.cell(0, 10, "PACKING LIST", 0, 1, 'C'); pdf.ln(5)
-    pdf.set_font("Helvetica", '', 9); y_start = pdf.get_y()
-    pdf.set_xy(10, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIPPER / EXPORTER:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_from)
-    pdf.set_xy(90, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIP TO:", 0, 1); pdf.set_xy(90, pdf.get_y()); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_ship)
-    pdf.set_xy(160, y_start); pdf.set_font("Helvetica", 'B', 12); pdf.cell(40, 6, f"Packing List #: {inv_num}", 0, 1, 'R'); pdf.set_x(160); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, f"Date: {inv_date}", 0, 1, 'R')
-    y_mid = max(pdf.get_y(), 50) + 10; pdf.set_xy(10, y_mid); pdf.set_font("Helvetica", 'B', 10); pdf.cell(80, 5, "BILL TO:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(80, 4, addr_to); pdf.set_y(y_mid + 35)
-    w = [30, 160]; headers = ["QTY", "PRODUCT"]
-    pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-    pdf.ln(); pdf.set_font("Helvetica", '', 7)
-    
-    def get_lines(text, width):
-        if not text: return 1
-        lines = 0; 
-        for para in str(text).split('\n'):
-            if not para: lines += 1; continue
-            words = para.split(' '); curr_w = 0; lines_para = 1
-            for word in words:
-                word_w = pdf.get_string_width(word + " ")
-                if curr_w + word_w > width: lines_para += 1; curr_w = word_w
-                else: curr_w += word_w
-            lines += lines_para
-        return lines
-
-    line_h = 5
-    for _, row in df.iterrows():
-        d_row = [(str(int(row['Quantity'])), 'C'), (str(row['Product Name']), 'L')]
-        max_lines = 1
-        for i, (txt, align) in enumerate(d_row):
-            lines = get_lines(txt, w[i] - 2)
-            if lines > max_lines: max_lines = lines
-        row_h = max_lines * line_h
-        
-        if pdf.get_y() + row_h > 270:
-            pdf.add_page(); pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-            for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-            pdf.ln(); pdf.set_font("Helvetica", '', 7)
-            
-        y_curr = pdf.get_y(); x_curr = 10
-        for i, (txt, align) in enumerate(d_row):
-            pdf.set_xy(x_curr + sum(w[:i]), y_curr)
-            pdf.multi_cell(w[i], line_h, txt, 0, align)
-        pdf.set_xy(10, y_curr)
-        for i in range(len(w)): pdf.rect(10 + sum(w[:i]), y_curr, w[i], row_h)
-        pdf.set_y(y_curr + row_h)
-
-    pdf.ln(5); pdf.set_font("Helvetica", 'B', 10); pdf.set_x(10); pdf.cell(sum(w), 8, f"TOTAL CARTONS: {cartons}", 0, 1, 'R')
-    return bytes(pdf.output())
-
-def generate_si_pdf(df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
-    pdf = ProInvoice(); pdf.alias_nb_pages(); pdf.add_page(); pdf.set_auto_page_break(auto=False)
-    pdf.set_font('Helvetica', 'B', 20); pdf.cell(0, 10, "SALES INVOICE", 0, 1, 'C'); pdf.ln(5)
-    
-    # Header
-    pdf.set_font("Helvetica", '', 9); y_start = pdf.get_y()
-    pdf.set_xy(10, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIPPER / EXPORTER:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_from)
-    pdf.set_xy(90, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, "SHIP TO:", 0, 1); pdf.set_xy(90, pdf.get_y()); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_ship)
-    
-    # Top Right Info Block
-    pdf.set_xy(160, y_start); pdf.set_font("Helvetica", 'B', 12); pdf.cell(40, 6, f"Invoice #: {inv_num}", 0, 1, 'R')
-    pdf.set_x(160); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, f"Date: {inv_date}", 0, 1, 'R')
-    pdf.set_x(160); pdf.cell(40, 6, f"Due Date: {inv_date}", 0, 1, 'R') # Added Due Date
-    pdf.set_x(160); pdf.cell(40, 6, "Currency: USD", 0, 1, 'R')
-
-    y_mid = max(pdf.get_y(), 50) + 10; pdf.set_xy(10, y_mid); pdf.set_font("Helvetica", 'B', 10); pdf.cell(80, 5, "BILL TO:", 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(80, 4, addr_to); pdf.set_y(y_mid + 35)
-    
-    w = [20, 100, 35, 35]; headers = ["QTY", "PRODUCT", "UNIT ($)", "TOTAL ($)"]
-    pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220); 
-    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-    pdf.ln(); pdf.set_font("Helvetica", '', 7)
-    
-    def get_lines(text, width):
-        if not text: return 1
-        lines = 0; 
-        for para in str(text).split('\n'):
-            if not para: lines += 1; continue
-            words = para.split(' '); curr_w = 0; lines_para = 1
-            for word in words:
-                word_w = pdf.get_string_width(word + " ")
-                if curr_w + word_w > width: lines_para += 1; curr_w = word_w
-                else: curr_w += word_w
-            lines += lines_para
-        return lines
-
-    line_h = 5
-    for _, row in df.iterrows():
-        d_row = [(str(int(row['Quantity'])), 'C'), (str(row['Description']), 'L'), (f"{row['Transfer Price (Unit)']:.2f}", 'R'), (f"{row['Transfer Total']:.2f}", 'R')]
-        max_lines = 1
-        for i, (txt, align) in enumerate(d_row):
-            lines = get_lines(txt, w[i] - 2)
-            if lines > max_lines: max_lines = lines
-        row_h = max_lines * line_h
-        if pdf.get_y() + row_h > 270:
-            pdf.add_page(); pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
-            for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
-            pdf.ln(); pdf.set_font("Helvetica", '', 7)
-        y_curr = pdf.get_y(); x_curr = 10
-        for i, (txt, align) in enumerate(d_row):
-            pdf.set_xy(x_curr + sum(w[:i]), y_curr); pdf.multi_cell(w[i], line_h, txt, 0, align)
-        pdf.set_xy(10, y_curr)
-        for i in range(len(w)): pdf.rect(10 + sum(w[:i]), y_curr, w[i], row_h)
-        pdf.set_y(y_curr + row_h)
-
-    pdf.ln(2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(sum(w[:-1]), 8, "TOTAL AMOUNT DUE (USD):", 0, 0, 'R'); pdf.cell(w[-1], 8, f"${total_val:,.2f}", 1, 1, 'R')
-    return bytes(pdf.output())
-
-def generate_customscity_csv(df, inv_number, inv_date, c_name, c_addr, c_city, c_state, c_zip, hbol_number, carrier_code):
-    weekday = inv_date.weekday()
-    days_to_add = 3 if weekday == 4 else (2 if weekday == 5 else 1)
-    est_arrival = inv_date + timedelta(days=days_to_add)
-    rows = []
-    for _, row in df.iterrows():
-        fda = str(row.get('FDA Code', '')).strip()
-        if not fda or fda.lower() == 'nan': continue
-        rows.append({
-            'Entry Type': '01', 'Reference Qualifier': 'BOL', 'Reference Number': '', 'Mode of Transport': '30', 'Bill Type': 'R',
-            'MBOL/TRIP Number': hbol_number, 'HBOL/ Shipment Control Number': hbol_number,
-            'Estimate Date of Arrival': est_arrival.strftime('%Y%m%d'), 'Time of Arrival': '18:00', 'US Port of Arrival': '0712',
-            'Equipment Number': '', 'Shipper Name': 'HOLISTIC ROASTERS', 'Shipper Address': '3780 RUE SAINT-PATRICK',
-            'Shipper City': 'MONTREAL', 'Shipper Country': 'CA', 'Consignee Name': c_name,
-            'Consignee Address': c_addr.replace('\n', ', '),
-            'Consignee City': c_city, 'Consignee State or Province': c_state, 'Consignee Postal Code': c_zip, 'Consignee Country': 'US',
-            'Description': row['Description'], 'Product ID': row.get('product_id', 'VARIOUS'), 'Carrier Name': carrier_code, 'Vessel Name': '',
-            'Voyage Trip Flight Number': hbol_number, 'Rail Car Number': ''
-        })
-    return pd.DataFrame(rows).to_csv(index=False).encode('utf-8')
-
 # ==================== PAGE 1: BATCHES ====================
 if page == "Batches (Dashboard)":
     st.header("📂 Batch Management")
@@ -737,19 +139,35 @@ if page == "Batches (Dashboard)":
             create_batch(new_batch_name)
             st.success("Batch created! Select it below.")
             st.rerun()
+
+    with st.expander("📦 Bulk Documents (Month-End)"):
+        all_batches = list_batches()
+        name_by_id = dict(zip(all_batches['id'].tolist(), all_batches['batch_name']))  # names repeat (one per day by default), ids don't
+        bulk_ids = st.multiselect("Batches", list(name_by_id), format_func=lambda i: f"{name_by_id[i]} (#{i})", key="bulk_batches")
+        if st.button("Generate ZIP", disabled=not bulk_ids):
+            bar = st.progress(0.0, text="Generating documents...")
+            buf = io.BytesIO()
+            try:
+                skipped = exports.write_bulk_zip(bulk_ids, buf, get_signature(),
+                                                 progress=lambda done, total, folder: bar.progress(done / total, text=f"{done}/{total} batches ready ({folder})"))
+                st.session_state['bulk_zip'] = buf.getvalue()
+                if skipped: st.warning(f"Skipped (no saved orders): {', '.join(skipped)}")
+            except exports.BatchNotFound as e: st.error(f"{e}; it may have been deleted. Please select the batches again.")
+        if st.session_state.get('bulk_zip'):
+            st.download_button("📥 Download ZIP", st.session_state['bulk_zip'], f"ExportDocuments_{date.today()}.zip", mime="application/zip", type="primary")
     
     st.markdown("---")
     
-    batches_df = get_batches()
+    batches_df = list_batches()
     if batches_df.empty:
         st.info("No active batches found. Create one above.")
     else:
         batch_options = batches_df['batch_name'].tolist()
         selected_batch_name = st.selectbox("Select Active Batch to Resume", batch_options)
         
-        batch_row = batches_df[batches_df['batch_name'] == selected_batch_name].iloc[0]
-        batch_id = int(batch_row['id'])
-        batch_data = json.loads(batch_row['data'])
+        batch_id = int(batches_df['id'].iloc[batch_options.index(selected_batch_name)])
+        batch_row = get_batch(batch_id)
+        batch_data = batch_row['data']
         
         # --- SESSION STATE FOR WORKFLOW ---
         if f'batch_{batch_id}_status' not in st.session_state:
@@ -764,7 +182,7 @@ if page == "Batches (Dashboard)":
             with col_settings:
                 st.subheader("⚙️ Settings")
                 st.markdown("**Signature**")
-                saved_sig = get_setting('signature')
+                saved_sig = get_signature()
                 if saved_sig: 
                     st.success("Signature Loaded")
                     if st.button("🗑️ Clear Signature", key=f"clear_sig_{batch_id}"):
@@ -808,81 +226,47 @@ if page == "Batches (Dashboard)":
                     b_notes = st.text_area("Notes", value=batch_data.get('notes', ""), height=100)
 
             st.subheader("📦 Orders")
-            cat_check = get_catalog()
+            cat_check = load_catalog()
             if cat_check.empty: st.error("🔴 Catalog is EMPTY. Please Restore Backup or Upload Catalog in the 'Catalog' tab.")
             else: st.success(f"✅ Catalog Loaded ({len(cat_check)} items)")
 
-            saved_orders_json = batch_data.get('orders_json')
+            saved_lines_digest = batch_data.get('lines_digest')
             uploaded_file = st.file_uploader("Upload CSV", type=['csv'])
             
-            df = pd.DataFrame()
-            unique_orders_count = 1
-            
-            if uploaded_file:
-                try:
-                    raw_df = pd.read_csv(uploaded_file)
-                    if 'Ship to country' in raw_df.columns:
-                        us_shipments = raw_df[raw_df['Ship to country'] == 'United States'].copy()
-                        if 'Item type' in raw_df.columns: us_shipments = us_shipments[us_shipments['Item type'] == 'product']
-                        
-                        possible_cols = ['SO #', 'Name', 'Order Name', 'Order Number']
-                        order_col = next((col for col in possible_cols if col in us_shipments.columns), None)
-                        if order_col: unique_orders_count = us_shipments[order_col].nunique()
-                        
-                        sales_data = us_shipments[['Variant code / SKU', 'Item variant', 'Quantity', 'Price per unit']].copy()
-                        sales_data['Variant code / SKU'] = sales_data['Variant code / SKU'].astype(str).str.strip()
-                        sales_data['CSV_Price'] = pd.to_numeric(sales_data['Price per unit'], errors='coerce').fillna(0)
-                        
-                        if not cat_check.empty:
-                            cat_check['sku'] = cat_check['sku'].apply(clean_sku)
-                            merged = pd.merge(sales_data, cat_check, left_on='Variant code / SKU', right_on='sku', how='left')
-                            merged['Product Name'] = merged['product_name'].fillna(merged['Item variant'])
-                            merged['Description'] = merged['description'].fillna(merged['Product Name'])
-                            merged['HTS Code'] = merged['hts_code'].fillna(DEFAULT_HTS)
-                            merged['FDA Code'] = merged['fda_code'].fillna(DEFAULT_FDA)
-                            merged['Weight (lbs)'] = merged['weight_lbs'].fillna(0.0)
-                            merged['unit_price'] = pd.to_numeric(merged['unit_price'], errors='coerce').fillna(0.0)
-                            merged['Transfer Price (Unit)'] = merged.apply(lambda x: x['unit_price'] if x['unit_price'] > 0 else x['CSV_Price'], axis=1)
-                            if 'country_of_origin' not in merged.columns: merged['country_of_origin'] = "CA"
-                            if 'product_id' not in merged.columns: merged['product_id'] = merged['Variant code / SKU']
-                            df = merged 
-                        else:
-                            sales_data['Product Name'] = sales_data['Item variant']
-                            sales_data['Description'] = sales_data['Item variant']
-                            sales_data['HTS Code'] = DEFAULT_HTS
-                            sales_data['FDA Code'] = DEFAULT_FDA
-                            sales_data['Weight (lbs)'] = 0.0
-                            sales_data['Transfer Price (Unit)'] = sales_data['CSV_Price']
-                            sales_data['country_of_origin'] = "CA"
-                            sales_data['product_id'] = sales_data['Variant code / SKU']
-                            df = sales_data
-                    else: st.error("Invalid CSV"); df = pd.DataFrame()
-                except Exception as e: st.error(f"Error reading CSV: {e}")
-            elif saved_orders_json:
-                try: df = pd.read_json(io.StringIO(saved_orders_json), orient='split')
-                except: st.error("Failed to load saved orders."); df = pd.DataFrame()
-
-            if not df.empty:
-                df['Transfer Total'] = df['Quantity'] * df['Transfer Price (Unit)']
+            # Orders are read, enriched and consolidated once per source (upload / saved orders) and
+            # catalog snapshot; reruns from grid edits reuse the model and only apply the edit deltas
+            if uploaded_file: source_key = f"upload:{uploaded_file.file_id}"
+            elif saved_lines_digest: source_key = f"saved:{saved_lines_digest}"
+            else: source_key = None
+            order_model = st.session_state.get(f'order_model_{batch_id}')
+            if source_key is None: order_model = None
+            elif order_model is None or not order_model.matches(source_key, cat_check):
+                df = pd.DataFrame()
+                unique_orders_count = 1
                 
-                df['FDA Code'] = df['FDA Code'].fillna("N/A")
-                df['country_of_origin'] = df['country_of_origin'].fillna("N/A")
-                df['product_id'] = df['product_id'].fillna("N/A")
+                if uploaded_file:
+                    try:
+                        us_lines = orders.read_us_product_lines(uploaded_file)
+                        if us_lines is not None:
+                            sales_data, unique_orders_count = us_lines
+                            
+                            df = orders.enrich_order_lines(sales_data, cat_check, DEFAULT_HTS, DEFAULT_FDA)
+                        else: st.error("Invalid CSV"); df = pd.DataFrame()
+                    except Exception as e: st.error(f"Error reading CSV: {e}")
+                else:
+                    try: df = get_batch_lines(batch_id)
+                    except: st.error("Failed to load saved orders."); df = pd.DataFrame()
 
-                consolidated = df.groupby(['product_id', 'HTS Code', 'Weight (lbs)', 'country_of_origin', 'FDA Code']).agg({
-                    'Quantity': 'sum',
-                    'Transfer Total': 'sum',
-                    'Product Name': 'first',
-                    'Description': 'first',
-                    'Variant code / SKU': lambda x: ', '.join(x.unique()) if len(x.unique()) < 3 else 'VARIOUS'
-                }).reset_index()
-                
-                consolidated['Transfer Price (Unit)'] = consolidated['Transfer Total'] / consolidated['Quantity']
-                
-                edited_df = st.data_editor(consolidated, num_rows="dynamic", use_container_width=True,
+                order_model = orders.OrderModel(source_key, cat_check, orders.consolidate_order_lines(df), unique_orders_count) if not df.empty else None
+            st.session_state[f'order_model_{batch_id}'] = order_model
+
+            if order_model is not None:
+                unique_orders_count = order_model.unique_orders_count
+                editor_key = f"orders_editor_{batch_id}_{order_model.token}"
+                edited_df = st.data_editor(order_model.consolidated, num_rows="dynamic", use_container_width=True, key=editor_key,
                     column_config={"Transfer Price (Unit)": st.column_config.NumberColumn("Unit Price ($)", format="$%.2f"),
                                    "Transfer Total": st.column_config.NumberColumn("Total ($)", format="$%.2f")})
-                total_val = edited_df['Transfer Total'].sum()
+                edited_df, total_val, calc_w = order_model.apply_edits(edited_df, st.session_state.get(editor_key))
                 st.metric("Total Value", f"${total_val:,.2f}")
                 
                 c_log1, c_log2, c_log3 = st.columns(3)
@@ -890,7 +274,6 @@ if page == "Batches (Dashboard)":
                 saved_cartons = batch_data.get('cartons', 1)
                 default_cartons = unique_orders_count if uploaded_file and unique_orders_count > 1 else saved_cartons
                 with c_log2: cartons = st.number_input("Cartons", value=default_cartons)
-                calc_w = (edited_df['Quantity'] * edited_df['Weight (lbs)']).sum()
                 saved_gw = batch_data.get('gross_weight', 0.0)
                 default_gw = calc_w + (pallets * 40) if saved_gw == 0.0 or uploaded_file else saved_gw
                 with c_log3: gross_weight = st.number_input("Gross Weight", value=float(default_gw))
@@ -901,12 +284,12 @@ if page == "Batches (Dashboard)":
                         "inv_number": b_inv_num, "inv_date": str(b_date), 
                         "cons_name": c_name, "cons_addr": c_addr, "cons_city": c_city, "cons_state": c_state, "cons_zip": c_zip, "cons_other": c_other,
                         "notes": b_notes, "carrier": sel_carrier,
-                        "pallets": pallets, "cartons": cartons, "gross_weight": gross_weight,
-                        "orders_json": edited_df.to_json(orient='split')
+                        "pallets": pallets, "cartons": cartons, "gross_weight": gross_weight
                     }
-                    update_batch(batch_id, save_data)
+                    update_batch(batch_id, save_data, edited_df)
                     st.session_state[f'batch_{batch_id}_status'] = 'Submitted'
                     st.session_state[f'dialog_stage_{batch_id}'] = 'step1'  # Initialize Dialog State
+                    st.session_state[f'prefetch_docs_{batch_id}'] = True
                     st.success("✅ Batch Submitted! Loading Documents..."); time.sleep(1); st.rerun()
 
         elif status == 'Submitted':
@@ -916,38 +299,28 @@ if page == "Batches (Dashboard)":
                 st.session_state[f'dialog_stage_{batch_id}'] = 'closed'
                 st.rerun()
             
-            # --- LOAD DATA FOR GENERATION ---
-            df = pd.read_json(io.StringIO(batch_data.get('orders_json')), orient='split')
-            b_inv_num = batch_data.get('inv_number')
-            b_date = datetime.strptime(batch_data.get('inv_date'), "%Y-%m-%d").date()
-            base_id = b_inv_num; hbol = f"HRUS{base_id}"
-            
-            c_name = batch_data.get('cons_name', DEF_CONS_NAME)
-            c_addr = batch_data.get('cons_addr', DEF_CONS_ADDR)
-            c_city = batch_data.get('cons_city', DEF_CONS_CITY)
-            c_state = batch_data.get('cons_state', DEF_CONS_STATE)
-            c_zip = batch_data.get('cons_zip', DEF_CONS_ZIP)
-            c_other = batch_data.get('cons_other', DEF_CONS_OTHER)
-            lines = [c_name, c_addr, f"{c_city}, {c_state} {c_zip}", c_other, "United States"]
-            full_consignee_txt = "\n".join([L for L in lines if L and L.strip()])
-            
-            b_notes = batch_data.get('notes')
-            carrier_name = batch_data.get('carrier')
-            pallets = batch_data.get('pallets')
-            cartons = batch_data.get('cartons')
-            gross_weight = batch_data.get('gross_weight')
-            total_val = df['Transfer Total'].sum()
-            
-            # --- GENERATE MASTER PRINT FILE ---
-            pdf_master = generate_master_print_file(df, b_inv_num, b_date, DEFAULT_SHIPPER, DEFAULT_IMPORTER, full_consignee_txt, b_notes, total_val, get_signature(), "Dean Turner", carrier_name, hbol, pallets, cartons, gross_weight)
-            csv_data = generate_customscity_csv(df, b_inv_num, b_date, c_name, c_addr, c_city, c_state, c_zip, hbol, "FX" if "FedEx" in carrier_name else "GCYD")
+            # --- DOCUMENTS (rendered on first use, then served from the document cache) ---
+            docs = exports.DocumentSet(batch_id, batch_data, get_signature())
+            b_inv_num = docs.inv_number; base_id = docs.base_id; c_name = docs.cons_name; carrier_name = docs.carrier
+            doc_key = docs.fingerprint
+            doc_files = docs.files
+            lazy_doc = docs.lazy
+
+            # Right after submit, render only the Step 1 master file; the other documents are rendered
+            # by the dialog (or download button) that first needs them
+            if st.session_state.pop(f'prefetch_docs_{batch_id}', False):
+                with st.spinner("Generating master print file..."):
+                    docs.prefetch(["master"])
+
+            pdf_master = lazy_doc("master")
+            csv_data = lazy_doc("customscity_csv")
             
             # Individual files
-            pdf_ci = generate_ci_pdf("COMMERCIAL INVOICE", df, f"CI-HRUS{base_id}", b_date, DEFAULT_SHIPPER, DEFAULT_IMPORTER, full_consignee_txt, b_notes, total_val, get_signature(), "Dean Turner")
-            pdf_pl = generate_pl_pdf(df, f"PL-HRUS{base_id}", b_date, DEFAULT_SHIPPER, DEFAULT_IMPORTER, full_consignee_txt, cartons)
-            pdf_bol = generate_bol_pdf(df, b_inv_num, b_date, DEFAULT_SHIPPER, full_consignee_txt, carrier_name, hbol, pallets, cartons, gross_weight, get_signature())
-            pdf_po = generate_po_pdf(df, f"PO-HRUS{base_id}", b_date, DEFAULT_IMPORTER, DEFAULT_SHIPPER, full_consignee_txt, total_val)
-            pdf_si = generate_si_pdf(df, f"SI-HRUS{base_id}", b_date, DEFAULT_SHIPPER, DEFAULT_IMPORTER, full_consignee_txt, b_notes, total_val, get_signature(), "Dean Turner")
+            pdf_ci = lazy_doc("ci")
+            pdf_pl = lazy_doc("pl")
+            pdf_bol = lazy_doc("bol")
+            pdf_po = lazy_doc("po")
+            pdf_si = lazy_doc("si")
 
             # --- DIALOG WORKFLOW (STATE-BASED) ---
             dialog_stage = st.session_state.get(f'dialog_stage_{batch_id}', 'closed')
@@ -958,7 +331,7 @@ if page == "Batches (Dashboard)":
                     st.warning("⚠️ **Action Required**: Please print the Master File below.")
                     st.markdown("**Contains:** 3x Commercial Invoice, 2x Bill of Lading")
                     
-                    st.download_button("📥 Download Master Print File (5 Pages)", pdf_master, f"MasterPrint_{base_id}.pdf", type="primary")
+                    st.download_button("📥 Download Master Print File (5 Pages)", pdf_master, f"MasterPrint_{base_id}.pdf", mime="application/pdf", type="primary")
 
                     st.markdown("---")
                     if st.button("✅ Confirmed Printed - Next: Customs Entry ➡️"):
@@ -973,7 +346,7 @@ if page == "Batches (Dashboard)":
                     
                     c1, c2, c3 = st.columns([1, 0.2, 1])
                     with c1:
-                        st.download_button("1. Download CSV", csv_data, f"CustomsCity_{base_id}.csv", type="primary", use_container_width=True)
+                        st.download_button("1. Download CSV", csv_data, f"CustomsCity_{base_id}.csv", mime="text/csv", type="primary", use_container_width=True)
                     with c2:
                         st.markdown("<h2 style='text-align: center; margin:0; padding:0;'>➡️</h2>", unsafe_allow_html=True)
                     with c3:
@@ -998,9 +371,9 @@ if page == "Batches (Dashboard)":
                     st.info(f"📧 Plan to email these documents to: **{carrier_name}**")
                     
                     c1, c2, c3 = st.columns(3)
-                    with c1: st.download_button("Commercial Invoice", pdf_ci, f"CI-HRUS{base_id}.pdf", use_container_width=True)
-                    with c2: st.download_button("Packing List", pdf_pl, f"PL-HRUS{base_id}.pdf", use_container_width=True)
-                    with c3: st.download_button("Bill of Lading", pdf_bol, f"BOL-HRUS{base_id}.pdf", use_container_width=True)
+                    with c1: st.download_button("Commercial Invoice", pdf_ci, f"CI-HRUS{base_id}.pdf", mime="application/pdf", use_container_width=True)
+                    with c2: st.download_button("Packing List", pdf_pl, f"PL-HRUS{base_id}.pdf", mime="application/pdf", use_container_width=True)
+                    with c3: st.download_button("Bill of Lading", pdf_bol, f"BOL-HRUS{base_id}.pdf", mime="application/pdf", use_container_width=True)
                     
                     st.markdown("---")
                     st.link_button("📧 Open Gmail to Compose", "https://mail.google.com/mail/u/0/#inbox?compose=new", use_container_width=True)
@@ -1066,7 +439,7 @@ if page == "Batches (Dashboard)":
                 def show_finance_dialog():
                     st.info("Please email the **Sales Invoice (SI)** to Airwallex (`holisticusa@bills.airwallex.com`).")
                     
-                    st.download_button("📥 Download Sales Invoice (SI)", pdf_si, f"SI-HRUS{base_id}.pdf", type="primary", use_container_width=True)
+                    st.download_button("📥 Download Sales Invoice (SI)", pdf_si, f"SI-HRUS{base_id}.pdf", mime="application/pdf", type="primary", use_container_width=True)
                     st.markdown("---")
                     
                     # Pre-filled Gmail Compose Link
@@ -1081,19 +454,27 @@ if page == "Batches (Dashboard)":
                             st.rerun()
                     with b2:
                         if st.button("All Done (Finish Batch) 🎉", type="primary", use_container_width=True):
+                            # Archive the final documents, mark the batch Completed and log it in the history
+                            with st.spinner("Archiving batch documents..."):
+                                docs.prefetch()
+                                documents = {name: (filename, mime, lazy_doc(name)()) for name, (filename, mime) in doc_files.items()}
+                                total_val = float(get_batch_lines(batch_id)['Transfer Total'].sum())
+                                complete_batch(batch_id, b_inv_num, total_val, c_name,
+                                               lambda c: doc_cache.store_batch_documents(c, batch_id, documents))
                             st.session_state[f'dialog_stage_{batch_id}'] = 'closed'
+                            st.session_state.pop(f'order_model_{batch_id}', None)
                             st.rerun()
                 show_finance_dialog()
 
             # --- REGULAR DOWNLOAD SECTION (Backup access) ---
             st.markdown("### 📂 All Batch Documents")
             c1, c2, c3, c4, c5, c6 = st.columns(6)
-            with c1: st.download_button("CI PDF", pdf_master, f"MasterPrint_{base_id}.pdf", key=f"dl_master_{batch_id}")
-            with c2: st.download_button("BOL PDF", pdf_bol, f"BOL-HRUS{base_id}.pdf", key=f"dl_bol_{batch_id}")
-            with c3: st.download_button("PO PDF", pdf_po, f"PO-HRUS{base_id}.pdf", key=f"dl_po_{batch_id}")
-            with c4: st.download_button("SI PDF", pdf_si, f"SI-HRUS{base_id}.pdf", key=f"dl_si_{batch_id}")
-            with c5: st.download_button("PL PDF", pdf_pl, f"PL-HRUS{base_id}.pdf", key=f"dl_pl_{batch_id}")
-            with c6: st.download_button("Customs CSV", csv_data, f"CustomsCity_{base_id}.csv", key=f"dl_csv_{batch_id}")
+            with c1: st.download_button("CI PDF", pdf_master, f"MasterPrint_{base_id}.pdf", mime="application/pdf", key=f"dl_master_{batch_id}")
+            with c2: st.download_button("BOL PDF", pdf_bol, f"BOL-HRUS{base_id}.pdf", mime="application/pdf", key=f"dl_bol_{batch_id}")
+            with c3: st.download_button("PO PDF", pdf_po, f"PO-HRUS{base_id}.pdf", mime="application/pdf", key=f"dl_po_{batch_id}")
+            with c4: st.download_button("SI PDF", pdf_si, f"SI-HRUS{base_id}.pdf", mime="application/pdf", key=f"dl_si_{batch_id}")
+            with c5: st.download_button("PL PDF", pdf_pl, f"PL-HRUS{base_id}.pdf", mime="application/pdf", key=f"dl_pl_{batch_id}")
+            with c6: st.download_button("Customs CSV", csv_data, f"CustomsCity_{base_id}.csv", mime="text/csv", key=f"dl_csv_{batch_id}")
             
             # EMAIL CENTER (Previous Logic)
             st.markdown("---")
@@ -1108,15 +489,26 @@ if page == "Batches (Dashboard)":
             
             body = st.text_area("Message Body", value="Hello,\n\nPlease find the attached export documents.\n\nThank you.", key=f"bod_{batch_id}")
             if st.button("📤 Send Email with Documents"):
-                files_to_send = [
-                    {'name': f"MasterPrint_{base_id}.pdf", 'data': pdf_master},
-                    {'name': f"CustomsCity_{base_id}.csv", 'data': csv_data}
-                ]
-                success, msg_res = send_email_with_attachments(sender_email, sender_pw, recip_email, subject, body, files_to_send)
-                if success:
-                    st.success("Email sent successfully!")
+                if not (sender_email and recip_email):
+                    st.error("Please enter your email and the recipient's.")
                 else:
-                    st.error(f"Failed to send email: {msg_res}")
+                    # Queued for the background mail worker, which reads the documents back from the cache
+                    attachments = [(*doc_files[name], f"{doc_key}:{name}", doc()) for name, doc in (("master", pdf_master), ("customscity_csv", csv_data))]
+                    mailer.enqueue(sender_email, sender_pw, recip_email, subject, body, attachments, batch_id=batch_id)
+
+            # Delivery status, polled while anything is still on its way
+            def show_outbox(polling):
+                messages = mailer.batch_messages(batch_id)
+                for msg_id, to, subj, status, attempts, error in messages:
+                    if status == 'sent': st.caption(f"✅ Sent to {to}: {subj}")
+                    elif status == 'sending': st.caption(f"📤 Sending to {to}...")
+                    elif status == 'queued' and attempts: st.caption(f"🔁 Retrying (attempt {attempts + 1}) to {to}: {error}")
+                    elif status == 'queued': st.caption(f"⏳ Queued for {to}")
+                    else: st.error(f"Failed to send email to {to}: {error}")
+                if polling and not any(m[3] in mailer.PENDING for m in messages): st.rerun()
+
+            polling = any(m[3] in mailer.PENDING for m in mailer.batch_messages(batch_id))
+            st.fragment(show_outbox, run_every=2 if polling else None)(polling)
 
 # ==================== PAGE 2: CATALOG ====================
 elif page == "Catalog":
@@ -1130,8 +522,8 @@ elif page == "Catalog":
         if cat_csv:
             try:
                 cdf = pd.read_csv(cat_csv)
-                upsert_catalog_from_df(cdf)
-                st.success(f"✅ Imported {len(cdf)} products!")
+                counts = upsert_catalog_from_df(cdf)
+                st.success(f"✅ Imported {len(cdf)} products! ({counts['inserted']} new, {counts['updated']} updated, {counts['unchanged']} unchanged)")
                 time.sleep(1)
                 st.rerun()
             except Exception as e:
@@ -1144,7 +536,7 @@ elif page == "Catalog":
 
     with c1:
         st.subheader("✏️ Edit Catalog")
-        cat_df = get_catalog()
+        cat_df = load_catalog().frame
         
         # If empty, provide a blank template row so it renders
         if cat_df.empty:
@@ -1153,23 +545,68 @@ elif page == "Catalog":
         edited_cat = st.data_editor(cat_df, num_rows="dynamic", use_container_width=True)
         
         if st.button("💾 Save Catalog Changes", type="primary"):
-            upsert_catalog_from_df(edited_cat)
-            st.success("✅ Catalog updated successfully!")
+            counts = upsert_catalog_from_df(edited_cat)
+            st.success(f"✅ Catalog updated successfully! ({counts['inserted']} new, {counts['updated']} updated)")
             time.sleep(1)
             st.rerun()
 
 # ==================== PAGE 3: ARCHIVE ====================
 elif page == "Archive (History)":
     st.header("🗄️ Invoice Archive")
-    hist_df = get_history()
-    if hist_df.empty:
+    f1, f2, f3, f4, f5 = st.columns([1, 1, 1.4, 0.8, 0.8])
+    with f1: inv_search = st.text_input("Invoice #")
+    with f2: buyer_sel = st.selectbox("Buyer", ["All"] + history_buyers())
+    with f3: date_range = st.date_input("Date Range", value=())
+    with f4: min_val = st.number_input("Min Value", value=None, min_value=0.0)
+    with f5: max_val = st.number_input("Max Value", value=None, min_value=0.0)
+    filters = {
+        "invoice_number": inv_search.strip() or None,
+        "buyer": None if buyer_sel == "All" else buyer_sel,
+        "date_from": date_range[0] if len(date_range) > 0 else None,
+        "date_to": date_range[1] if len(date_range) > 1 else (date_range[0] if len(date_range) > 0 else None),
+        "min_value": min_val, "max_value": max_val,
+    }
+
+    # Keyset pagination: the stack holds the before_id of every page up to the current one
+    if st.session_state.get('archive_filters') != filters:
+        st.session_state['archive_filters'] = filters
+        st.session_state['archive_cursors'] = [None]
+    cursors = st.session_state['archive_cursors']
+    page_df = history_page(before_id=cursors[-1], limit=ARCHIVE_PAGE_SIZE + 1, **filters)
+    has_next = len(page_df) > ARCHIVE_PAGE_SIZE
+    page_df = page_df.iloc[:ARCHIVE_PAGE_SIZE]
+
+    inv_count, inv_total = history_summary(**filters)
+    if inv_count == 0:
         st.info("No records found.")
     else:
-        st.dataframe(hist_df, use_container_width=True)
+        st.caption(f"{inv_count} invoices | ${inv_total:,.2f} | Page {len(cursors)}")
+        st.dataframe(page_df.drop(columns=['id', 'batch_id']), use_container_width=True, hide_index=True)
+        p1, p2, _ = st.columns([1, 1, 6])
+        with p1:
+            if st.button("◀ Previous", disabled=len(cursors) == 1):
+                cursors.pop(); st.rerun()
+        with p2:
+            if st.button("Next ▶", disabled=not has_next):
+                cursors.append(int(page_df['id'].iloc[-1])); st.rerun()
+        # Finished batches: their documents are served from the archive, nothing is re-rendered
+        archived = page_df.dropna(subset=['batch_id'])
+        if not archived.empty:
+            with st.expander("📂 Archived Documents"):
+                labels = {r.id: f"{r.invoice_number} — {r.buyer_name} ({r.date_created})" for r in archived.itertuples()}
+                hist_id = st.selectbox("Invoice", list(labels), format_func=labels.get)
+                arch_batch = int(archived.set_index('id').at[hist_id, 'batch_id'])
+                stored = doc_cache.batch_documents(arch_batch)
+                if not stored: st.info("No documents stored for this invoice.")
+                for col, (name, filename, mime, size) in zip(st.columns(max(1, len(stored))), stored):
+                    with col: st.download_button(f"{filename} ({size / 1024:,.0f} KB)", functools.partial(doc_cache.load_batch_document, arch_batch, name),
+                                                 filename, mime=mime, key=f"arch_{arch_batch}_{name}")
+        with st.expander("📅 Monthly Totals"):
+            st.dataframe(history_monthly_totals(**filters), use_container_width=True, hide_index=True,
+                         column_config={"total_value": st.column_config.NumberColumn("Total ($)", format="$%.2f")})
 
 import streamlit as st
 from datetime import datetime
-from fpdf import FPDF
 import urllib.parse
 
 def draw_intercompany_invoice():
@@ -1195,6 +632,7 @@ def draw_intercompany_invoice():
 
     if st.button("📄 Generate Invoice PDF"):
         # 2. Build the PDF
+        from fpdf import FPDF  # only this button needs fpdf
         pdf = FPDF()
         pdf.add_page()
         
@@ -1298,3 +736,6 @@ def draw_intercompany_invoice():
 # Add this line at the bottom of your app to display the module:
 draw_intercompany_invoice()
 
+instrument.end()
+show_perf_panel()
+
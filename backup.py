@@ -0,0 +1,107 @@
+import gzip
+import io
+import shutil
+import tempfile
+import threading
+import os
+import sqlite3
+from datetime import datetime
+
+import db
+
+# --- Database Backups ---
+# Backups are only made when someone downloads one: the live database is copied with SQLite's
+# online backup API (consistent, doesn't block other sessions) and gzip-compressed. The last
+# snapshot is kept in memory along with the database's change key, so downloading again before
+# anything has changed costs nothing. Page loads never read the database file.
+
+BACKUP_PAGES = 1024    # pages (4 KB each) copied per backup step
+BACKUP_SLEEP = 0.005   # pause between steps, letting writers in
+GZIP_LEVEL = 6
+GZIP_MAGIC = b'\x1f\x8b'
+
+_lock = threading.Lock()
+_last = (None, None)  # (change key, compressed snapshot)
+
+def backup_filename():
+    return f"holistic_backup_{datetime.now().strftime('%Y-%m-%d_%H%M')}.db.gz"
+
+def compressed_snapshot(database=None):
+    # gzip'd copy of the database as of now, reused while nothing has changed
+    global _last
+    database = database or db.get_db()
+    with _lock:
+        key = (database.path,) + database.change_key()
+        if _last[0] == key: return _last[1]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'snapshot.db')
+            database.backup_to(path, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP)
+            out = io.BytesIO()
+            with open(path, 'rb') as src, gzip.GzipFile(filename='invoices.db', mode='wb', fileobj=out, compresslevel=GZIP_LEVEL) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+            data = out.getvalue()
+        _last = (key, data)
+        return data
+
+def last_saved(path=db.DB_PATH):
+    # When the database (or its write-ahead log) was last written, from file metadata only
+    times = [os.path.getmtime(p) for p in (path, path + '-wal') if os.path.exists(p)]
+    return datetime.fromtimestamp(max(times)) if times else None
+
+# --- Restore ---
+# An uploaded backup is streamed to a temp file (gunzipped on the way), checked, migrated to the
+# current schema and only then copied into the live database (db.Database.restore_from). All the
+# slow work happens on the copy, so other sessions carry on until the final swap.
+
+REQUIRED_TABLES = ('product_catalog_v3', 'batches', 'settings', 'invoice_history_v3')
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+class RestoreError(Exception):
+    pass
+
+def _spool(fileobj, path):
+    fileobj.seek(0)
+    magic = fileobj.read(2)
+    fileobj.seek(0)
+    src = gzip.GzipFile(fileobj=fileobj, mode='rb') if magic == GZIP_MAGIC else fileobj
+    try:
+        with open(path, 'wb') as out: shutil.copyfileobj(src, out, 1024 * 1024)
+    except (OSError, EOFError) as e: raise RestoreError(f"Could not read the backup: {e}")
+
+def _validate(path):
+    with open(path, 'rb') as f:
+        if f.read(16) != SQLITE_HEADER: raise RestoreError("Not a SQLite database file")
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if result != ['ok']: raise RestoreError(f"Integrity check failed: {'; '.join(result[:3])}")
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        missing = [t for t in REQUIRED_TABLES if t not in tables]
+        if missing: raise RestoreError(f"Not an Export Hub database (missing {', '.join(missing)})")
+    except sqlite3.DatabaseError as e: raise RestoreError(f"Damaged database: {e}")
+    finally: conn.close()
+
+def _match_page_size(path, page_size):
+    # The backup API can't copy into a WAL database with a different page size
+    conn = sqlite3.connect(path)
+    try:
+        if conn.execute("PRAGMA page_size").fetchone()[0] != page_size:
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(f"PRAGMA page_size={int(page_size)}")
+            conn.execute("VACUUM")
+    finally: conn.close()
+
+def restore(fileobj, database=None):
+    # fileobj: the uploaded .db or .db.gz (any binary file object). Raises RestoreError and leaves
+    # the live database untouched if the backup is unusable.
+    database = database or db.get_db()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'restore.db')
+        _spool(fileobj, path)
+        _validate(path)
+        try:
+            db.Database(path).close()  # opening runs any pending migrations on the copy
+            with database.lock: page_size = database.conn.execute("PRAGMA page_size").fetchone()[0]
+            _match_page_size(path, page_size)
+        except Exception as e: raise RestoreError(f"Could not upgrade the backup: {e}") from e
+        database.restore_from(path)
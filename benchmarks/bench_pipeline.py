@@ -0,0 +1,186 @@
+# End-to-end pipeline benchmark on synthetic catalogs and order exports, no Streamlit.
+#   python benchmarks/bench_pipeline.py [--sizes 100 1000 10000 100000] [--out results.json]
+#   python benchmarks/bench_pipeline.py --compare old.json new.json
+# For each size (order lines, also used as catalog size) it times the catalog upsert, reading the
+# order CSV, enrichment + consolidation, the CustomsCity CSV, the CI PDF (draw_ci_page) and the
+# master print file, then measures each stage's peak Python memory in a second, traced pass.
+# Results are written as JSON (with versions and git commit) so runs can be compared.
+# PDF stages scale with the number of customs lines: at 100k order lines each one takes minutes.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+from importlib import metadata
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import db
+import orders
+import exports
+from documents import generate_ci_pdf, generate_master_print_file, generate_customscity_csv
+
+WORDS = ("single origin organic whole bean espresso blend medium roast dark roast decaf swiss water process "
+         "notes of chocolate caramel citrus berry washed natural honey processed arabica 12oz 2lb bag").split()
+SIZES = [100, 1000, 10_000, 100_000]
+
+# --- Synthetic data ---
+def _description(rng):
+    lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))).capitalize() for _ in range(rng.randint(1, 4))]
+    return "\n".join(lines)
+
+def synthetic_catalog(rows, seed=11):
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        'SKU': [f"HR-{i:06d}" for i in range(rows)],
+        'Product Name': [f"Coffee {i % 500} {rng.choice(WORDS)}" for i in range(rows)],
+        'Description': [_description(rng) for _ in range(rows)],
+        'HTS Code': ["0901.21.00.20" if i % 9 else "" for i in range(rows)],
+        'FDA Code': ["31ADT01"] * rows,
+        'Weight (lbs)': [round(0.5 + (i % 8) * 0.25, 2) for i in range(rows)],
+        'Unit Price': [0.0 if i % 4 == 0 else round(4 + (i % 13) * 0.75, 2) for i in range(rows)],
+        'Country of Origin': ["CA"] * rows,
+        'Product ID': [f"P{i // 6}" for i in range(rows)],
+    })
+
+def write_order_csv(path, lines, skus, seed=13):
+    # A storefront export: US product lines plus Canadian orders and shipping lines to filter out
+    rng = random.Random(seed)
+    total = int(lines * 1.25)
+    countries = ["United States"] * 4 + ["Canada"]
+    df = pd.DataFrame({
+        'SO #': [f"SO{i // 4}" for i in range(total)],
+        'Ship to country': [countries[i % 5] for i in range(total)],
+        'Item type': ["product" if i % 20 else "shipping" for i in range(total)],
+        'Variant code / SKU': [f"HR-{rng.randrange(skus):06d}" for _ in range(total)],
+        'Item variant': [f"Variant {rng.randint(1, 40)}" for _ in range(total)],
+        'Quantity': [rng.randint(1, 12) for _ in range(total)],
+        'Price per unit': [f"{rng.uniform(3, 30):.2f}" for _ in range(total)],
+        'Customer note': [_description(rng) if i % 7 == 0 else "" for i in range(total)],
+    })
+    df.to_csv(path, index=False)
+
+# --- Stages ---
+def stages(lines, workdir):
+    # [(name, callable)] for one size; each callable returns a short description of its output
+    state = {}
+    sig = None
+    inv_date = date(2026, 1, 31)
+
+    def catalog_upsert():
+        counts = db.upsert_catalog_from_df(state['catalog'])
+        return f"{counts['inserted']} new"
+
+    def catalog_upsert_unchanged():
+        counts = db.upsert_catalog_from_df(state['catalog'])
+        return f"{counts['unchanged']} unchanged"
+
+    def read_orders():
+        with open(state['csv'], 'rb') as f: state['sales'], _ = orders.read_us_product_lines(f)
+        return f"{len(state['sales'])} lines"
+
+    def enrich_consolidate():
+        enriched = orders.enrich_order_lines(state['sales'], db.load_catalog(), exports.DEFAULT_HTS, exports.DEFAULT_FDA)
+        state['lines'] = orders.consolidate_order_lines(enriched)
+        return f"{len(state['lines'])} customs lines"
+
+    def customscity_csv():
+        data = generate_customscity_csv(state['lines'], "BENCH1", inv_date, "Border Mail Depot", "102 W. Service Road", "Champlain", "NY", "12919", "HRUSBENCH1", "GCYD")
+        return f"{len(data)} bytes"
+
+    def ci_pdf():
+        total = state['lines']['Transfer Total'].sum()
+        data = generate_ci_pdf("COMMERCIAL INVOICE", state['lines'], "CI-HRUSBENCH1", inv_date, exports.DEFAULT_SHIPPER, exports.DEFAULT_IMPORTER, exports.DEFAULT_CONSIGNEE_FULL, exports.DEFAULT_NOTES, total, sig, exports.SIGNER)
+        return f"{len(data)} bytes"
+
+    def master_print():
+        total = state['lines']['Transfer Total'].sum()
+        data = generate_master_print_file(state['lines'], "BENCH1", inv_date, exports.DEFAULT_SHIPPER, exports.DEFAULT_IMPORTER, exports.DEFAULT_CONSIGNEE_FULL, exports.DEFAULT_NOTES, total, sig, exports.SIGNER, "GCYD (Green City Courier)", "HRUSBENCH1", 1, 10, 500.0)
+        return f"{len(data)} bytes"
+
+    def setup():
+        state['catalog'] = synthetic_catalog(lines)
+        state['csv'] = os.path.join(workdir, f"orders_{lines}.csv")
+        write_order_csv(state['csv'], lines, lines)
+
+    return setup, [("catalog_upsert", catalog_upsert), ("catalog_upsert_unchanged", catalog_upsert_unchanged),
+                   ("read_orders", read_orders), ("enrich_consolidate", enrich_consolidate),
+                   ("customscity_csv", customscity_csv), ("ci_pdf", ci_pdf), ("master_print", master_print)]
+
+def fresh_database(workdir, tag):
+    database = db.Database(os.path.join(workdir, f"bench_{tag}.db"))
+    db.set_provider(lambda: database)
+    return database
+
+def run_size(lines, workdir, memory=True):
+    results = {}
+    setup, steps = stages(lines, workdir)
+    setup()
+    database = fresh_database(workdir, f"{lines}_time")
+    for name, fn in steps:
+        t = time.perf_counter(); out = fn(); dt = time.perf_counter() - t
+        results[name] = {'stage': name, 'lines': lines, 'seconds': round(dt, 4), 'output': out}
+        print(f"{lines:>7} {name:<26} {dt * 1000:10.1f} ms   {out}", flush=True)
+    database.close()
+    if memory:
+        # Second pass under tracemalloc (slower, so timings come from the first pass)
+        database = fresh_database(workdir, f"{lines}_mem")
+        for name, fn in steps:
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name]['peak_mb'] = round(peak / 2 ** 20, 2)
+        database.close()
+    return list(results.values())
+
+# --- Reporting ---
+def environment():
+    def version(pkg):
+        try: return metadata.version(pkg)
+        except metadata.PackageNotFoundError: return None
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError: commit = None
+    return {'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': commit,
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'packages': {pkg: version(pkg) for pkg in ('pandas', 'numpy', 'fpdf2', 'streamlit')}}
+
+def compare(old_path, new_path, threshold=1.2):
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    before = {(r['stage'], r['lines']): r for r in old['results']}
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    regressions = 0
+    for r in new['results']:
+        o = before.get((r['stage'], r['lines']))
+        if o is None: continue
+        ratio = r['seconds'] / o['seconds'] if o['seconds'] else float('inf')
+        flag = "  <-- slower" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{r['lines']:>7} {r['stage']:<26} {o['seconds'] * 1000:10.1f} -> {r['seconds'] * 1000:10.1f} ms  x{ratio:5.2f}{flag}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--out", default=None, help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak-memory pass")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files and exit (1 if any stage is >20%% slower)")
+    args = parser.parse_args()
+    if args.compare: sys.exit(compare(*args.compare))
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for lines in args.sizes: results += run_size(lines, workdir, memory=not args.no_memory)
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f: json.dump({'meta': environment(), 'results': results}, f, indent=2)
+    print(f"Results written to {out}")
@@ -0,0 +1,69 @@
+# Cold-start profile of the app.
+#   python benchmarks/bench_startup.py [--runs 5]
+# 1. Import-time profile (python -X importtime) of the app's own modules in a fresh interpreter:
+#    total time, the slowest imports, and whether the PDF/email/process-pool stacks were loaded.
+# 2. First run of the app (dashboard, empty database), then the Archive page, through streamlit's
+#    AppTest in a fresh interpreter: wall times, peak RSS and which heavy modules were imported.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_MODULES = "backup, db, doc_cache, exports, instrument, mailer, orders"
+HEAVY = ["fpdf", "smtplib", "ssl", "email.mime.multipart", "multiprocessing", "concurrent.futures", "pytz", "documents", "render_pool"]
+
+def import_profile():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {APP_MODULES}"], cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((name, int(self_us), int(cumulative_us)))
+    names = {name.strip() for name, _, _ in rows}
+    top_level = [r for r in rows if not r[0].startswith(" ")]
+    return {
+        'total_ms': round(sum(c for _, _, c in top_level) / 1000, 1),
+        'slowest': [(name.strip(), round(c / 1000, 1)) for name, _, c in sorted(top_level, key=lambda r: -r[2])[:8]],
+        'heavy_loaded': [m for m in HEAVY if m in names],
+    }
+
+FIRST_RUN = r"""
+import json, resource, sys, time
+from streamlit.testing.v1 import AppTest
+t = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+at.run()
+first = time.perf_counter() - t
+at.sidebar.radio[0].set_value("Archive (History)")
+t = time.perf_counter(); at.run(); archive = time.perf_counter() - t
+print(json.dumps({'first_run_s': first, 'archive_run_s': archive, 'exceptions': [str(e.value) for e in at.exception],
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'heavy_loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+def first_run(runs):
+    # Each run starts from an empty database in a scratch folder
+    results = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            proc = subprocess.run([sys.executable, "-W", "ignore", "-c", FIRST_RUN % (HEAVY,), os.path.join(ROOT, "app.py")], cwd=workdir, capture_output=True, text=True)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        'first_run_s': round(statistics.median(r['first_run_s'] for r in results), 3),
+        'archive_run_s': round(statistics.median(r['archive_run_s'] for r in results), 3),
+        'max_rss_mb': round(statistics.median(r['max_rss_mb'] for r in results), 1),
+        'heavy_loaded': results[-1]['heavy_loaded'],
+        'exceptions': results[-1]['exceptions'],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    profiles = [import_profile() for _ in range(args.runs)]
+    imports = dict(profiles[-1], total_ms=round(statistics.median(p['total_ms'] for p in profiles), 1))
+    print(json.dumps({'imports': imports, 'dashboard_then_archive': first_run(args.runs)}, indent=2))
@@ -0,0 +1,126 @@
+import argparse
+import os
+import sys
+from datetime import date
+
+import db
+
+# --- Command Line ---
+# Document generation without Streamlit, for cron jobs and other services:
+#   python cli.py list
+#   python cli.py batch 12 --out docs/              # one batch's documents as files
+#   python cli.py batch 12 13 14 --zip month.zip    # several batches, one folder each
+#   python cli.py orders export.csv --name "Export-2026-10-16" --out docs/
+# `orders` imports a storefront CSV into a new batch (as the Edit page's upload + SUBMIT would)
+# and generates its documents. Nothing here imports streamlit.
+
+def _signature(args):
+    if args.signature:
+        with open(args.signature, 'rb') as f: return f.read()
+    return db.get_setting('signature')
+
+def _write_files(docs, out_dir, names=None):
+    os.makedirs(out_dir, exist_ok=True)
+    names = names or list(docs.files)
+    docs.prefetch(names)
+    for name in names:
+        filename, mime = docs.files[name]
+        path = os.path.join(out_dir, filename)
+        with open(path, 'wb') as f: f.write(docs.lazy(name)())
+        print(path)
+
+def _write_zip(batch_ids, path, sig_bytes, names=None):
+    import exports
+    try:
+        with open(path, 'wb') as f:
+            skipped = exports.write_bulk_zip(batch_ids, f, sig_bytes, progress=lambda done, total, folder: print(f"[{done}/{total}] {folder}", file=sys.stderr), names=names)
+    except exports.BatchNotFound as e:
+        os.remove(path)
+        print(e, file=sys.stderr); return 1
+    for folder in skipped: print(f"Skipped (no saved orders): {folder}", file=sys.stderr)
+    print(path)
+    return 0
+
+def cmd_list(args):
+    batches = db.list_batches(args.status)
+    if batches.empty: print(f"No {args.status} batches."); return 0
+    print(batches.to_string(index=False))
+    return 0
+
+def cmd_batch(args):
+    import exports
+    sig_bytes = _signature(args)
+    if args.zip: return _write_zip(args.batch_ids, args.zip, sig_bytes, args.docs)
+    for batch_id in args.batch_ids:
+        row = db.get_batch(batch_id)
+        if row is None: print(f"Batch {batch_id} not found", file=sys.stderr); return 1
+        docs = exports.DocumentSet(batch_id, row['data'], sig_bytes)
+        if not docs.has_lines: print(f"Batch {batch_id} has no saved orders", file=sys.stderr); return 1
+        _write_files(docs, os.path.join(args.out, str(batch_id)) if len(args.batch_ids) > 1 else args.out, args.docs)
+    return 0
+
+def cmd_orders(args):
+    import exports
+    import orders
+    with open(args.csv, 'rb') as f: us_lines = orders.read_us_product_lines(f)
+    if us_lines is None: print("Not a storefront export (no 'Ship to country' column)", file=sys.stderr); return 1
+    sales_data, unique_orders_count = us_lines
+    if sales_data.empty: print("No US product lines in the export", file=sys.stderr); return 1
+    lines = orders.consolidate_order_lines(orders.enrich_order_lines(sales_data, db.load_catalog(), exports.DEFAULT_HTS, exports.DEFAULT_FDA))
+    total_value = float(lines['Transfer Total'].sum())
+    calc_weight = float((lines['Quantity'] * lines['Weight (lbs)']).sum())
+
+    batch_id = exports.create_batch(args.name or f"Export-{date.today()}")
+    data = db.get_batch(batch_id)['data']
+    if args.inv_number: data['inv_number'] = args.inv_number
+    if args.date: data['inv_date'] = args.date
+    if args.carrier: data['carrier'] = args.carrier
+    # Same defaults as the Edit page for a fresh upload
+    data['pallets'] = args.pallets if args.pallets is not None else data.get('pallets', 1)
+    data['cartons'] = args.cartons if args.cartons is not None else (unique_orders_count if unique_orders_count > 1 else data.get('cartons', 1))
+    data['gross_weight'] = args.gross_weight if args.gross_weight is not None else calc_weight + data['pallets'] * 40
+    db.update_batch(batch_id, data, lines)
+    print(f"Batch {batch_id}: {len(lines)} lines, ${total_value:,.2f}", file=sys.stderr)
+
+    data = db.get_batch(batch_id)['data']
+    _write_files(exports.DocumentSet(batch_id, data, _signature(args)), args.out, args.docs)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Holistic Roasters export documents, without the web app")
+    parser.add_argument("--db", default=db.DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--signature", help="signature image to use instead of the saved one")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="list batches")
+    p.add_argument("--status", default="Active", choices=["Active", "Completed"])
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("batch", help="generate the documents of saved batches")
+    p.add_argument("batch_ids", type=int, nargs="+")
+    p.add_argument("--out", default=".", help="output folder (a subfolder per batch when several are given)")
+    p.add_argument("--zip", help="write every batch into this ZIP instead")
+    p.add_argument("--docs", nargs="+", choices=["master", "customscity_csv", "ci", "pl", "bol", "po", "si"], help="only these documents")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("orders", help="import a storefront orders CSV as a new batch and generate its documents")
+    p.add_argument("csv")
+    p.add_argument("--name", help="batch name (default: Export-<today>)")
+    p.add_argument("--inv-number")
+    p.add_argument("--date", help="invoice date, YYYY-MM-DD")
+    p.add_argument("--carrier")
+    p.add_argument("--pallets", type=int)
+    p.add_argument("--cartons", type=int)
+    p.add_argument("--gross-weight", type=float)
+    p.add_argument("--out", default=".")
+    p.add_argument("--docs", nargs="+", choices=["master", "customscity_csv", "ci", "pl", "bol", "po", "si"], help="only these documents")
+    p.set_defaults(func=cmd_orders)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db.DB_PATH = args.db
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,572 @@
+import sqlite3
+import threading
+import contextlib
+import functools
+import json
+import hashlib
+import io
+from datetime import datetime, timedelta
+import pandas as pd
+
+import instrument
+
+# --- Data Access ---
+# One long-lived SQLite connection per process, shared by every session and guarded by a lock.
+# The app hands in a provider backed by st.cache_resource (set_provider); scripts without
+# Streamlit get a plain process-wide instance. Schema changes live in MIGRATIONS and run once
+# per database, recorded in the schema_migrations table.
+
+DB_PATH = 'invoices.db'
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # WAL + NORMAL: durable across app crashes, one fsync per checkpoint
+    "PRAGMA busy_timeout=5000",      # other processes (backups, scripts) wait instead of failing
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # 16 MB page cache
+    "PRAGMA mmap_size=67108864",
+)
+
+# --- Prepared Statements ---
+# Named SQL used on the hot paths. sqlite3 keeps each compiled statement in the connection's
+# statement cache, so after the first call they run without being parsed again.
+SQL = {
+    'get_setting': "SELECT value FROM settings WHERE key=?",
+    'save_setting': "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+    'delete_setting': "DELETE FROM settings WHERE key=?",
+    'get_revision': "SELECT value FROM revisions WHERE name=?",
+    'bump_revision': "INSERT INTO revisions (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+    'get_catalog': "SELECT * FROM product_catalog_v3",
+    'upsert_catalog': """INSERT OR REPLACE INTO product_catalog_v3
+                         (sku, product_name, description, hts_code, fda_code, weight_lbs, unit_price, country_of_origin, product_id)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    'clear_catalog': "DELETE FROM product_catalog_v3",
+    'list_batches': "SELECT id, batch_name, updated_at, status FROM batches WHERE status=? ORDER BY updated_at DESC",
+    'get_batch': "SELECT id, batch_name, status, created_at, updated_at, data FROM batches WHERE id=?",
+    'latest_batch_data': "SELECT data FROM batches ORDER BY updated_at DESC LIMIT 1",
+    'insert_batch': "INSERT INTO batches (batch_name, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+    'update_batch': "UPDATE batches SET data=?, updated_at=? WHERE id=?",
+    'delete_batch_lines': "DELETE FROM batch_lines WHERE batch_id=?",
+    'insert_batch_line': "INSERT INTO batch_lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    'get_batch_lines': """SELECT product_id, hts_code, weight_lbs, country_of_origin, fda_code, quantity, transfer_total,
+                              product_name, description, skus, unit_price
+                       FROM batch_lines WHERE batch_id=? ORDER BY line_no""",
+    'finalize_batch': "UPDATE batches SET status='Completed' WHERE id=?",
+    'insert_history': """INSERT INTO invoice_history_v3
+                         (invoice_number, date_created, total_value, buyer_name, batch_id)
+                         VALUES (?, ?, ?, ?, ?)""",
+}
+
+# --- Schema Migrations ---
+def _add_column(c, table, column, decl):
+    if column not in {row[1] for row in c.execute(f"PRAGMA table_info({table})")}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def _migration_1(c):
+    # Baseline schema (what init_db used to create on every run), including the old column ALTERs
+    c.execute('''CREATE TABLE IF NOT EXISTS invoice_history_v3
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  invoice_number TEXT,
+                  date_created TEXT,
+                  total_value REAL,
+                  buyer_name TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS product_catalog_v3
+                 (sku TEXT PRIMARY KEY,
+                  product_name TEXT,
+                  description TEXT,
+                  hts_code TEXT,
+                  fda_code TEXT,
+                  weight_lbs REAL,
+                  unit_price REAL,
+                  country_of_origin TEXT,
+                  product_id TEXT)''')
+    _add_column(c, 'product_catalog_v3', 'unit_price', 'REAL')
+    _add_column(c, 'product_catalog_v3', 'country_of_origin', 'TEXT')
+    _add_column(c, 'product_catalog_v3', 'product_id', 'TEXT')
+    c.execute('''CREATE TABLE IF NOT EXISTS settings
+                 (key TEXT PRIMARY KEY,
+                  value BLOB)''')
+    # Change counters for tables whose contents are cached in memory across reruns
+    c.execute('''CREATE TABLE IF NOT EXISTS revisions
+                 (name TEXT PRIMARY KEY,
+                  value INTEGER)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS batches
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  batch_name TEXT,
+                  status TEXT,
+                  created_at TEXT,
+                  updated_at TEXT,
+                  data TEXT)''')
+    # Rendered documents (see doc_cache)
+    c.execute('''CREATE TABLE IF NOT EXISTS document_cache
+                 (key TEXT PRIMARY KEY,
+                  data BLOB,
+                  size INTEGER,
+                  last_used REAL)''')
+
+def _migration_2(c):
+    # Order lines move out of the batches.data JSON (orders_json, itself a JSON string) into batch_lines
+    c.execute('''CREATE TABLE IF NOT EXISTS batch_lines
+                 (batch_id INTEGER NOT NULL,
+                  line_no INTEGER NOT NULL,
+                  product_id TEXT,
+                  hts_code TEXT,
+                  weight_lbs REAL,
+                  country_of_origin TEXT,
+                  fda_code TEXT,
+                  quantity NUMERIC,
+                  transfer_total REAL,
+                  product_name TEXT,
+                  description TEXT,
+                  skus TEXT,
+                  unit_price REAL,
+                  PRIMARY KEY (batch_id, line_no)) WITHOUT ROWID''')
+    for batch_id, data in c.execute("SELECT id, data FROM batches").fetchall():
+        data = json.loads(data)
+        orders_json = data.pop('orders_json', None)
+        lines = None
+        if orders_json:
+            # dtype=False/convert_dates=False: values as saved, so codes like '0901' keep their leading zeros
+            try: lines = pd.read_json(io.StringIO(orders_json), orient='split', dtype=False, convert_dates=False)
+            except Exception as e: print(f"Batch {batch_id}: saved orders unreadable, dropped: {e}")
+        data['lines_digest'] = _write_batch_lines(c, batch_id, lines)
+        c.execute("UPDATE batches SET data=? WHERE id=?", (json.dumps(data), batch_id))
+
+def _migration_3(c):
+    # Batch index: listing by status, newest first, without touching the data column
+    c.execute("CREATE INDEX IF NOT EXISTS idx_batches_status_updated ON batches (status, updated_at)")
+
+def _migration_4(c):
+    # Archive lookups: keyset paging walks the id primary key; filters use these
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_invoice_number ON invoice_history_v3 (invoice_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_buyer ON invoice_history_v3 (buyer_name)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_date ON invoice_history_v3 (date_created)")
+
+def _migration_5(c):
+    # Documents of completed batches (see doc_cache), stored once per distinct content
+    c.execute('''CREATE TABLE IF NOT EXISTS document_blobs
+                 (digest TEXT PRIMARY KEY,
+                  codec TEXT,
+                  size INTEGER,
+                  data BLOB)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS batch_documents
+                 (batch_id INTEGER NOT NULL,
+                  name TEXT NOT NULL,
+                  filename TEXT,
+                  mime TEXT,
+                  digest TEXT,
+                  PRIMARY KEY (batch_id, name))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_batch_documents_digest ON batch_documents (digest)")
+    _add_column(c, 'invoice_history_v3', 'batch_id', 'INTEGER')
+
+def _migration_6(c):
+    # Outgoing mail queue (see mailer); attachments are document cache keys, passwords are never stored
+    c.execute('''CREATE TABLE IF NOT EXISTS outbox
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  batch_id INTEGER,
+                  sender TEXT,
+                  recipient TEXT,
+                  subject TEXT,
+                  body TEXT,
+                  attachments TEXT,
+                  smtp_host TEXT,
+                  smtp_port INTEGER,
+                  status TEXT,
+                  attempts INTEGER,
+                  next_attempt REAL,
+                  last_error TEXT,
+                  created_at REAL,
+                  updated_at REAL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON outbox (status, next_attempt)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_id, id)")
+
+MIGRATIONS = [_migration_1, _migration_2, _migration_3, _migration_4, _migration_5, _migration_6]  # append only; position + 1 is the schema version
+
+# --- Connection ---
+class Database:
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = None
+        self.generation = 0  # bumped on every (re)open and restore, so in-memory caches never outlive a restored file
+        self.open()
+
+    def open(self):
+        # isolation_level=None: statements autocommit unless wrapped in transaction()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, cached_statements=256)
+        for pragma in PRAGMAS: self.conn.execute(pragma)
+        self.generation += 1
+        self.migrate()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None: self.conn.close()
+            self.conn = None
+
+    def migrate(self):
+        with self.transaction() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, applied_at TEXT)")
+            current = c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+            for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+                migration(c)
+                c.execute("INSERT INTO schema_migrations (version, applied_at) VALUES (?, ?)", (version, datetime.now().isoformat(timespec='seconds')))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # Write lock taken up front (IMMEDIATE) so a transaction never fails half-way on a busy upgrade
+        with self.lock:
+            c = self.conn.cursor()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                yield c
+                c.execute("COMMIT")
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally: c.close()
+
+    @contextlib.contextmanager
+    def cursor(self):
+        with self.lock:
+            c = self.conn.cursor()
+            try: yield c
+            finally: c.close()
+
+    def query_one(self, name, params=()):
+        with self.cursor() as c:
+            c.execute(SQL[name], params)
+            return c.fetchone()
+
+    def read_frame(self, name, params=()):
+        with self.lock: return pd.read_sql_query(SQL[name], self.conn, params=params)
+
+    def change_key(self):
+        # Changes so far by this connection (total_changes) and by any other one (data_version); no I/O
+        with self.lock:
+            return (self.generation, self.conn.total_changes, self.conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def backup_to(self, path, pages=1024, sleep=0.005):
+        # Consistent copy of the live database through SQLite's online backup API. It is copied
+        # `pages` at a time and the lock isn't held, so other sessions keep reading and writing.
+        dest = sqlite3.connect(path)
+        try: self.conn.backup(dest, pages=pages, sleep=sleep)
+        finally: dest.close()
+
+    def restore_from(self, path):
+        # Replace the live contents with a validated, migrated database file (see backup.restore).
+        # The copy is one backup step into this connection, so other connections see either the
+        # old or the new database, never a mix; in-memory caches follow the generation bump.
+        src = sqlite3.connect(path)
+        try:
+            with self.lock:
+                src.backup(self.conn)
+                self.generation += 1
+                for hook in _restore_hooks: hook(self)
+        finally: src.close()
+
+_restore_hooks = []
+
+def on_restore(hook):
+    # hook(database) runs right after a restore, before anyone else can use the connection
+    _restore_hooks.append(hook)
+
+_provider = None
+_default = None
+_default_lock = threading.Lock()
+
+def set_provider(provider):
+    # provider() returns the Database to use (the app passes an st.cache_resource function)
+    global _provider
+    _provider = provider
+
+def get_db():
+    if _provider is not None: return _provider()
+    global _default
+    with _default_lock:
+        if _default is None: _default = Database(DB_PATH)
+        return _default
+
+# --- Revisions ---
+def bump_revision(c, name):
+    c.execute(SQL['bump_revision'], (name,))
+
+def get_revision(name):
+    row = get_db().query_one('get_revision', (name,))
+    return row[0] if row else 0
+
+# --- Settings ---
+def save_setting(key, value_bytes):
+    with get_db().transaction() as c:
+        c.execute(SQL['save_setting'], (key, value_bytes))
+        bump_revision(c, 'settings')
+
+def get_setting(key):
+    row = get_db().query_one('get_setting', (key,))
+    return row[0] if row else None
+
+def clear_signature():
+    with get_db().transaction() as c:
+        c.execute(SQL['delete_setting'], ('signature',))
+        bump_revision(c, 'settings')
+
+# --- Catalog ---
+def clean_sku(val):
+    if pd.isna(val) or val == "": return ""
+    val_str = str(val).strip()
+    if val_str.endswith(".0"): return val_str[:-2]
+    return val_str
+
+@instrument.traced()
+def get_catalog():
+    return get_db().read_frame('get_catalog')
+
+CATALOG_COLUMNS = ['sku', 'product_name', 'description', 'hts_code', 'fda_code', 'weight_lbs', 'unit_price', 'country_of_origin', 'product_id']
+CATALOG_COL_MAP = {
+    'price': 'unit_price', 'cost': 'unit_price', 'unit price': 'unit_price',
+    'origin': 'country_of_origin', 'country': 'country_of_origin', 'coo': 'country_of_origin', 'country of origin': 'country_of_origin',
+    'weight': 'weight_lbs', 'lbs': 'weight_lbs', 'weight (lbs)': 'weight_lbs',
+    'sku': 'sku', 'variant code': 'sku', 'variant code / sku': 'sku',
+    'product': 'product_name', 'name': 'product_name', 'item variant': 'product_name',
+    'desc': 'description', 'description': 'description',
+    'hts': 'hts_code', 'hs code': 'hts_code', 'hts code': 'hts_code',
+    'fda': 'fda_code', 'fda code': 'fda_code',
+    'product id': 'product_id', 'id': 'product_id', 'prod id': 'product_id', 'master sku': 'product_id'
+}
+
+def _text_column(df, col, default=''):
+    # Column as str (None where missing/NaN); `default` when the column isn't there at all
+    if col not in df.columns: return pd.Series(default, index=df.index, dtype=object)
+    s = df[col]
+    return s.astype(str).astype(object).where(s.notna(), None)
+
+def _number_column(df, col, default=0.0):
+    # float(); empty or unparseable cells become `default`
+    if col not in df.columns: return pd.Series(default, index=df.index, dtype=float)
+    return pd.to_numeric(df[col], errors='coerce').astype(float).fillna(default)
+
+def _blank(s, strip=False):
+    s_text = s.fillna('')
+    return s.isna() | ((s_text.str.strip() if strip else s_text) == '')
+
+def normalize_catalog(df):
+    # Uploaded/edited catalog rows -> CATALOG_COLUMNS with the same cleanup the row-by-row import did
+    df = df.rename(columns=lambda col: CATALOG_COL_MAP.get(str(col).strip().lower(), str(col).strip().lower()))
+    df = df.loc[:, ~df.columns.duplicated()]
+    sku = _text_column(df, 'sku').fillna('').str.strip().str.replace(r'\.0$', '', regex=True)
+    p_name = _text_column(df, 'product_name')
+    desc = _text_column(df, 'description')
+    origin = _text_column(df, 'country_of_origin', 'CA')
+    prod_id = _text_column(df, 'product_id')
+    out = pd.DataFrame({
+        'sku': sku,
+        'product_name': p_name,
+        'description': desc.mask(_blank(desc), p_name),
+        'hts_code': _text_column(df, 'hts_code'),
+        'fda_code': _text_column(df, 'fda_code'),
+        'weight_lbs': _number_column(df, 'weight_lbs'),
+        'unit_price': _number_column(df, 'unit_price'),
+        'country_of_origin': origin.mask(_blank(origin), 'CA'),
+        'product_id': prod_id.mask(_blank(prod_id, strip=True), sku),
+    }, columns=CATALOG_COLUMNS)
+    out = out[out['sku'] != '']
+    return out.drop_duplicates('sku', keep='last')  # later rows win, as with one INSERT OR REPLACE per row
+
+def _same_values(a, b):
+    return (a == b).fillna(False).astype(bool) | (a.isna() & b.isna())
+
+@instrument.traced()
+def upsert_catalog_from_df(df):
+    # Writes only rows that are new or differ from the stored catalog, in one transaction.
+    # Returns {'inserted': n, 'updated': n, 'unchanged': n}.
+    rows = normalize_catalog(df)
+    with get_db().transaction() as c:
+        c.execute(SQL['get_catalog'])
+        stored = pd.DataFrame(c.fetchall(), columns=[d[0] for d in c.description]).astype(object)
+        merged = rows.merge(stored[CATALOG_COLUMNS], on='sku', how='left', suffixes=('', '_old'), indicator=True)
+        is_new = (merged['_merge'] == 'left_only').to_numpy()
+        unchanged = ~is_new
+        for col in CATALOG_COLUMNS[1:]:
+            unchanged &= _same_values(merged[col], merged[col + '_old']).to_numpy()
+        changed = rows[~unchanged]
+        if len(changed):
+            c.executemany(SQL['upsert_catalog'], changed.astype(object).where(changed.notna(), None).itertuples(index=False, name=None))
+            bump_revision(c, 'catalog')
+    return {'inserted': int(is_new.sum()), 'updated': int((~is_new & ~unchanged).sum()), 'unchanged': int(unchanged.sum())}
+
+def clear_catalog():
+    with get_db().transaction() as c:
+        c.execute(SQL['clear_catalog'])
+        bump_revision(c, 'catalog')
+
+class CatalogSnapshot:
+    # The catalog as of one revision. `frame` is the table as stored (for display/editing);
+    # `by_sku` is indexed by the cleaned SKU, ready to join order lines against. Shared between
+    # sessions, so treat both as read-only.
+    def __init__(self, frame):
+        self.frame = frame
+        self.by_sku = frame.assign(sku=frame['sku'].map(clean_sku)).set_index('sku')
+
+    def __len__(self): return len(self.frame)
+
+    @property
+    def empty(self): return self.frame.empty
+
+_catalog_cache = {}
+_catalog_lock = threading.Lock()
+
+@instrument.traced()
+def load_catalog():
+    # Re-read only when upsert_catalog_from_df/clear_catalog (from any process) bumped the revision
+    database = get_db()
+    key = (id(database), database.generation, get_revision('catalog'))
+    with _catalog_lock:
+        snapshot = _catalog_cache.get(key)
+        if snapshot is None:
+            snapshot = CatalogSnapshot(get_catalog())
+            _catalog_cache.clear()
+            _catalog_cache[key] = snapshot
+        return snapshot
+
+# --- Batches ---
+@functools.cache
+def _eastern():
+    import pytz  # loads its zone database; deferred to the first timestamp
+    return pytz.timezone('US/Eastern')
+
+def _now_est(fmt="%Y-%m-%d %H:%M:%S"):
+    return datetime.now(_eastern()).strftime(fmt)
+
+@instrument.traced()
+def list_batches(status='Active'):
+    # id, batch_name, updated_at, status of every batch in `status`, most recently saved first
+    return get_db().read_frame('list_batches', (status,))
+
+@instrument.traced()
+def get_batch(batch_id):
+    # One batch with its header fields decoded into 'data', or None
+    row = get_db().query_one('get_batch', (batch_id,))
+    if row is None: return None
+    batch = dict(zip(['id', 'batch_name', 'status', 'created_at', 'updated_at', 'data'], row))
+    batch['data'] = json.loads(batch['data'])
+    return batch
+
+def create_batch(name, new_data):
+    # new_data: the app's defaults for a fresh batch; consignee/shipping fields carry over from the latest batch
+    now = _now_est()
+    with get_db().transaction() as c:
+        try:
+            c.execute(SQL['latest_batch_data'])
+            row = c.fetchone()
+            if row:
+                last_data = json.loads(row[0])
+                if 'cons_name' in last_data: new_data['cons_name'] = last_data['cons_name']
+                if 'cons_addr' in last_data: new_data['cons_addr'] = last_data['cons_addr']
+                if 'cons_city' in last_data: new_data['cons_city'] = last_data['cons_city']
+                if 'cons_state' in last_data: new_data['cons_state'] = last_data['cons_state']
+                if 'cons_zip' in last_data: new_data['cons_zip'] = last_data['cons_zip']
+                if 'cons_other' in last_data: new_data['cons_other'] = last_data['cons_other']
+
+                if 'notes' in last_data and last_data['notes']: new_data['notes'] = last_data['notes']
+                if 'carrier' in last_data: new_data['carrier'] = last_data['carrier']
+                if 'gross_weight' in last_data: new_data['gross_weight'] = last_data['gross_weight']
+                if 'pallets' in last_data: new_data['pallets'] = last_data['pallets']
+        except Exception as e:
+            print(f"Inheritance error: {e}")
+
+        c.execute(SQL['insert_batch'], (name, 'Active', now, now, json.dumps(new_data)))
+        return c.lastrowid
+
+@instrument.traced()
+def update_batch(batch_id, data_dict, lines):
+    # data_dict: header fields; lines: the consolidated order table (stored in batch_lines)
+    with get_db().transaction() as c:
+        data_dict = dict(data_dict, lines_digest=_write_batch_lines(c, batch_id, lines))
+        c.execute(SQL['update_batch'], (json.dumps(data_dict), _now_est(), batch_id))
+
+# --- Batch Lines ---
+# (order table column, batch_lines column), in the order the tables show them
+BATCH_LINE_COLUMNS = [
+    ('product_id', 'product_id'), ('HTS Code', 'hts_code'), ('Weight (lbs)', 'weight_lbs'),
+    ('country_of_origin', 'country_of_origin'), ('FDA Code', 'fda_code'), ('Quantity', 'quantity'),
+    ('Transfer Total', 'transfer_total'), ('Product Name', 'product_name'), ('Description', 'description'),
+    ('Variant code / SKU', 'skus'), ('Transfer Price (Unit)', 'unit_price'),
+]
+
+def _write_batch_lines(c, batch_id, lines):
+    # Replaces the batch's lines; returns a digest of them (kept in the header as lines_digest) or None
+    c.execute(SQL['delete_batch_lines'], (batch_id,))
+    if lines is None or lines.empty: return None
+    frame = lines.reindex(columns=[col for col, _ in BATCH_LINE_COLUMNS]).astype(object)
+    values = list(frame.where(frame.notna(), None).itertuples(index=False, name=None))
+    c.executemany(SQL['insert_batch_line'], [(batch_id, line_no) + row for line_no, row in enumerate(values)])
+    return hashlib.sha1(json.dumps(values, default=str).encode('utf-8')).hexdigest()
+
+@instrument.traced()
+def get_batch_lines(batch_id):
+    with get_db().cursor() as c:
+        c.execute(SQL['get_batch_lines'], (batch_id,))
+        rows = c.fetchall()
+    return pd.DataFrame(rows, columns=[col for col, _ in BATCH_LINE_COLUMNS])
+
+def finalize_batch_in_db(batch_id):
+    with get_db().transaction() as c:
+        c.execute(SQL['finalize_batch'], (batch_id,))
+
+@instrument.traced()
+def complete_batch(batch_id, inv_num, total_val, buyer, store_documents=None):
+    # Finish a batch in one transaction: store_documents(c) persists its files (doc_cache.store_batch_documents),
+    # then the batch is marked Completed and recorded in the invoice history
+    with get_db().transaction() as c:
+        if store_documents is not None: store_documents(c)
+        c.execute(SQL['finalize_batch'], (batch_id,))
+        c.execute(SQL['insert_history'], (inv_num, _now_est("%Y-%m-%d %H:%M EST"), total_val, buyer, batch_id))
+
+# --- History ---
+def save_invoice_metadata(inv_num, total_val, buyer, batch_id=None):
+    with get_db().transaction() as c:
+        c.execute(SQL['insert_history'], (inv_num, _now_est("%Y-%m-%d %H:%M EST"), total_val, buyer, batch_id))
+
+# --- Archive Queries ---
+# date_created is stored as 'YYYY-MM-DD HH:MM EST', so date ranges are plain string comparisons.
+def _history_filters(date_from=None, date_to=None, buyer=None, min_value=None, max_value=None, invoice_number=None):
+    clauses, params = [], []
+    if date_from is not None: clauses.append("date_created >= ?"); params.append(str(date_from))
+    if date_to is not None: clauses.append("date_created < ?"); params.append(str(date_to + timedelta(days=1)))
+    if buyer: clauses.append("buyer_name = ?"); params.append(buyer)
+    if invoice_number: clauses.append("invoice_number = ?"); params.append(invoice_number)
+    if min_value is not None: clauses.append("total_value >= ?"); params.append(min_value)
+    if max_value is not None: clauses.append("total_value <= ?"); params.append(max_value)
+    return clauses, params
+
+@instrument.traced()
+def history_page(before_id=None, limit=50, **filters):
+    # One page of the archive, newest first. Pass the last id of a page as before_id to get the next one.
+    clauses, params = _history_filters(**filters)
+    if before_id is not None: clauses.append("id < ?"); params.append(before_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    database = get_db()
+    with database.lock:
+        return pd.read_sql_query(f"""SELECT id, invoice_number, date_created, buyer_name, total_value, batch_id FROM invoice_history_v3
+                                    {where} ORDER BY id DESC LIMIT ?""", database.conn, params=params + [limit])
+
+@instrument.traced()
+def history_summary(**filters):
+    # (invoice count, total value) over everything matching the filters
+    clauses, params = _history_filters(**filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with get_db().cursor() as c:
+        c.execute(f"SELECT COUNT(*), COALESCE(SUM(total_value), 0) FROM invoice_history_v3 {where}", params)
+        return c.fetchone()
+
+def history_monthly_totals(**filters):
+    clauses, params = _history_filters(**filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    database = get_db()
+    with database.lock:
+        return pd.read_sql_query(f"""SELECT substr(date_created, 1, 7) AS month, COUNT(*) AS invoices, SUM(total_value) AS total_value
+                                    FROM invoice_history_v3 {where} GROUP BY month ORDER BY month DESC""", database.conn, params=params)
+
+def history_buyers():
+    with get_db().cursor() as c:
+        c.execute("SELECT DISTINCT buyer_name FROM invoice_history_v3 WHERE buyer_name IS NOT NULL ORDER BY buyer_name")
+        return [row[0] for row in c.fetchall()]
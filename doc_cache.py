@@ -0,0 +1,132 @@
+import hashlib
+import json
+import threading
+import time
+import zlib
+
+import db
+import instrument
+
+# --- Rendered Document Cache ---
+# Generated PDFs/CSVs are stored in the `document_cache` table (see db.MIGRATIONS), keyed by a
+# hash of everything that goes into them. Reruns and reopened batches serve the stored bytes
+# instead of running fpdf2 again.
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+RENDER_VERSION = "2"  # bump when a generator's output changes so stale entries are never served
+
+def batch_fingerprint(batch_data, sig_bytes, *extra):
+    # batch_data holds the header fields and lines_digest (which stands in for the order lines); extra covers app-level constants (addresses, signer)
+    h = hashlib.sha256(RENDER_VERSION.encode('utf-8'))
+    h.update(json.dumps(batch_data, sort_keys=True, default=str).encode('utf-8'))
+    h.update(b'\0' + (sig_bytes or b''))
+    for part in extra: h.update(b'\0' + str(part).encode('utf-8'))
+    return h.hexdigest()
+
+# Reads don't write: the time each key was last served is kept here and only written to last_used
+# by the next put_document, which is when eviction needs it. A read is then one SELECT that never
+# waits on a writer, and doesn't change the database (or backup.compressed_snapshot's change key).
+_touched = {}  # key -> time last served, not yet in last_used
+_touched_lock = threading.Lock()
+
+def _forget_touches(database):
+    with _touched_lock: _touched.clear()
+
+db.on_restore(_forget_touches)
+
+@instrument.traced()
+def get_document(key):
+    with db.get_db().cursor() as c:
+        c.execute("SELECT data FROM document_cache WHERE key=?", (key,))
+        row = c.fetchone()
+    if row is None: return None
+    with _touched_lock: _touched[key] = time.time()
+    return bytes(row[0])
+
+def store_document(c, key, data):
+    # c: a cursor inside the caller's transaction. Keys are content hashes, so an entry that is
+    # already there holds these bytes: only its last_used moves.
+    c.execute("""INSERT INTO document_cache (key, data, size, last_used) VALUES (?, ?, ?, ?)
+                 ON CONFLICT(key) DO UPDATE SET last_used=excluded.last_used""", (key, data, len(data), time.time()))
+
+def put_document(key, data, max_bytes=MAX_CACHE_BYTES):
+    with _touched_lock:
+        touched = [(t, k, t) for k, t in _touched.items()]; _touched.clear()
+    with db.get_db().transaction() as c:
+        c.executemany("UPDATE document_cache SET last_used=? WHERE key=? AND last_used<?", touched)  # best effort: lost if this fails
+        store_document(c, key, data)
+        # LRU eviction: keep the most recently used entries whose running size fits the budget.
+        # Attachments of mail still in the outbox (mailer.PENDING) are kept until it has gone out
+        # and don't count against the budget.
+        c.execute("""DELETE FROM document_cache WHERE key IN (
+                         SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS running
+                                          FROM document_cache WHERE key NOT IN (
+                                              SELECT json_extract(a.value, '$[2]') FROM outbox o, json_each(o.attachments) a
+                                              WHERE o.status IN ('queued', 'sending')))
+                         WHERE running > ?)""", (max_bytes,))
+
+def missing_documents(fingerprint, names):
+    with db.get_db().cursor() as c:
+        c.execute("SELECT key FROM document_cache WHERE key LIKE ?", (f"{fingerprint}:%",))
+        have = {row[0] for row in c.fetchall()}
+    return [n for n in names if f"{fingerprint}:{n}" not in have]
+
+def cached_document(fingerprint, name, producer):
+    key = f"{fingerprint}:{name}"
+    data = get_document(key)
+    if data is None:
+        data = producer()
+        put_document(key, data)
+    return data
+
+# --- Deferred Producers ---
+class LazyDocument:
+    # Wraps a generate_* call so nothing is rendered until the bytes are asked for. Instances are
+    # callables, so they can be handed straight to st.download_button(data=...) and only run on click.
+    def __init__(self, fingerprint, name, producer):
+        self.fingerprint = fingerprint
+        self.name = name
+        self.producer = producer
+        self._data = None
+
+    def __call__(self):
+        if self._data is None:
+            self._data = cached_document(self.fingerprint, self.name, self.producer)
+        return self._data
+
+# --- Archived Batch Documents ---
+# When a batch is completed its files are kept for good (unlike the LRU cache above): each
+# distinct file is stored once in document_blobs, keyed by its sha256 and zlib-compressed when
+# that actually saves space, and batch_documents maps (batch, document) to it.
+
+def _store_blob(c, data):
+    digest = hashlib.sha256(data).hexdigest()
+    packed = zlib.compress(data, 6)
+    codec, payload = ('zlib', packed) if len(packed) < len(data) else ('raw', data)
+    c.execute("INSERT OR IGNORE INTO document_blobs (digest, codec, size, data) VALUES (?, ?, ?, ?)",
+              (digest, codec, len(data), payload))
+    return digest
+
+def store_batch_documents(c, batch_id, documents):
+    # documents: {name: (filename, mime, bytes)}; c: a cursor inside the caller's transaction
+    c.execute("DELETE FROM batch_documents WHERE batch_id=?", (batch_id,))
+    for name, (filename, mime, data) in documents.items():
+        c.execute("INSERT INTO batch_documents (batch_id, name, filename, mime, digest) VALUES (?, ?, ?, ?, ?)",
+                  (batch_id, name, filename, mime, _store_blob(c, data)))
+    c.execute("DELETE FROM document_blobs WHERE digest NOT IN (SELECT digest FROM batch_documents)")
+
+def batch_documents(batch_id):
+    # [(name, filename, mime, size)] of a completed batch
+    with db.get_db().cursor() as c:
+        c.execute("""SELECT d.name, d.filename, d.mime, b.size FROM batch_documents d
+                     JOIN document_blobs b ON b.digest = d.digest WHERE d.batch_id=? ORDER BY d.rowid""", (batch_id,))
+        return c.fetchall()
+
+def load_batch_document(batch_id, name):
+    with db.get_db().cursor() as c:
+        c.execute("""SELECT b.codec, b.data FROM batch_documents d
+                     JOIN document_blobs b ON b.digest = d.digest WHERE d.batch_id=? AND d.name=?""", (batch_id, name))
+        row = c.fetchone()
+    if row is None: return None
+    codec, payload = row
+    return zlib.decompress(payload) if codec == 'zlib' else bytes(payload)
@@ -0,0 +1,381 @@
+
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from fpdf.image_parsing import get_img_info
+from datetime import timedelta
+import pandas as pd
+import functools
+import hashlib
+import io
+
+import instrument
+import text_metrics
+
+# --- PDF Class ---
+class ReplayablePDF(FPDF):
+    # Remembers where each page's body ends (before the footer is drawn) so laid-out pages can be copied
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.body_ends = {}
+    def footer(self):
+        self.body_ends[self.page] = len(self.pages[self.page].contents)
+
+class ProInvoice(ReplayablePDF):
+    def header(self): pass
+    def footer(self):
+        super().footer()
+        self.set_y(-15); self.set_font('Helvetica', 'I', 8); self.cell(0, 10, f'Page {self.page_no()} of {{nb}}', 0, 0, 'R')
+
+# --- PAGE REPLICATION ---
+# PageSnapshot and SignatureImage work on fpdf2 internals (page content streams, the resource
+# catalog, the image cache): fpdf2 is pinned in requirements.txt and tests/test_documents.py checks
+# the output against plain fpdf2 rendering.
+class PageSnapshot:
+    # The finished content streams (minus footers) of pages first..last of a ReplayablePDF, plus the
+    # fonts/images each page uses. replay() emits them as new pages without redoing any layout;
+    # footers are still drawn per copy so page numbers stay correct.
+    def __init__(self, pdf, first_page):
+        catalog = pdf._resource_catalog.resources_per_page
+        self.pages = []
+        for n in range(first_page, pdf.page + 1):
+            contents = pdf.pages[n].contents
+            body = bytes(contents[:pdf.body_ends.get(n, len(contents))])
+            resources = {rtype: set(names) for (page, rtype), names in catalog.items() if page == n}
+            self.pages.append((body, resources))
+        self.end_y = pdf.get_y()
+
+    def replay(self, pdf):
+        catalog = pdf._resource_catalog.resources_per_page
+        for body, resources in self.pages:
+            pdf.add_page()
+            # q/Q keeps fpdf2's idea of the current font/colours in sync with the stream; the body was
+            # laid out on a fresh page, so start it from the default black stroke/fill like the original
+            pdf._out(b"q\n0 G\n0 g\n" + body + b"Q")
+            for rtype, names in resources.items(): catalog[(pdf.page, rtype)].update(names)
+        pdf.set_y(self.end_y)
+
+def draw_copies(pdf, copies, draw_page, *args):
+    first_page = pdf.page + 1
+    draw_page(pdf, *args)
+    snapshot = PageSnapshot(pdf, first_page)
+    for _ in range(copies - 1): snapshot.replay(pdf)
+
+# --- SIGNATURE IMAGE ---
+class SignatureImage:
+    # The signature decoded once per process and shared by every page and document of a run. fpdf2
+    # keys in-memory images by the md5 of their bytes, so the decoded info is registered in each
+    # pdf's image cache under that key and pdf.image() finds it instead of parsing the PNG again.
+    def __init__(self, sig_bytes):
+        self.data = sig_bytes
+        self.name = hashlib.md5(sig_bytes.strip()).hexdigest()
+        try: self.info = get_img_info(self.name, io.BytesIO(sig_bytes))
+        except Exception: self.info = None  # unreadable upload: documents go out unsigned, as before
+
+    def place(self, pdf, x, y, w):
+        if self.info is None: return
+        images = pdf.image_cache.images
+        if self.name not in images and self.info.get("iccp") is None and pdf.image_cache.image_filter == "AUTO":
+            info = images[self.name] = type(self.info)(self.info)
+            info["i"] = len(images); info["usages"] = 0; info["iccp_i"] = None
+        try: pdf.image(self.data, x=x, y=y, w=w)
+        except: pass
+
+@functools.lru_cache(maxsize=4)
+def signature_image(sig_bytes):
+    return SignatureImage(sig_bytes)
+
+# --- LAYOUT TEMPLATES ---
+# The CI, PO, SI and PL share one layout: a title, two address columns with the document number
+# block on the right, a third address (plus the notes box on the CI) below them, then a table that
+# breaks to a new page at y=270 with its header repeated. A DocTemplate describes one document;
+# draw_document() renders any of them. The static part of the header (everything but the number
+# block) is laid out once per template and addresses, then replayed onto each new document.
+
+class Column:
+    # One table column: header, width (mm), alignment and texts(df) -> the cell text of every order line
+    def __init__(self, header, width, align, texts):
+        self.header = header
+        self.width = width
+        self.align = align
+        self.texts = texts
+
+class DocTemplate:
+    # title: None to take it from the 'title' field; left/middle/lower: (label, field) address blocks;
+    # number_lines: format strings over the fields, the first one in bold; summary(pdf, widths,
+    # fields) draws whatever follows the table
+    def __init__(self, title, left, middle, number_lines, lower, columns, summary, min_mid_y=50, notes_box=False):
+        self.title = title
+        self.left = left
+        self.middle = middle
+        self.number_lines = number_lines
+        self.lower = lower
+        self.columns = columns
+        self.summary = summary
+        self.min_mid_y = min_mid_y
+        self.notes_box = notes_box
+        self.widths = [c.width for c in columns]
+        self.xs = [10 + sum(self.widths[:i]) for i in range(len(columns))]
+
+# Column texts, built a whole column at a time
+def _qty(df): return [str(int(q)) for q in df['Quantity']]
+
+def _text(col, default=None):
+    # default=None: the column is required
+    def texts(df):
+        if default is not None and col not in df.columns: return [str(default)] * len(df)
+        return [str(v) for v in df[col]]
+    return texts
+
+def _money(col):
+    return lambda df: [f"{v:.2f}" for v in df[col]]
+
+def _unit_weight(df):
+    weights = df['Weight (lbs)'] if 'Weight (lbs)' in df.columns else [0] * len(df)
+    return [f"{v:.2f} lbs" for v in weights]
+
+def _total_row(label):
+    def draw(pdf, widths, fields):
+        pdf.ln(2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(sum(widths[:-1]), 8, label, 0, 0, 'R'); pdf.cell(widths[-1], 8, f"${fields['total_val']:,.2f}", 1, 1, 'R')
+    return draw
+
+def _carton_total(pdf, widths, fields):
+    pdf.ln(5); pdf.set_font("Helvetica", 'B', 10); pdf.set_x(10); pdf.cell(sum(widths), 8, f"TOTAL CARTONS: {fields['cartons']}", 0, 1, 'R')
+
+_PRODUCT_COLUMNS = [Column("QTY", 20, 'C', _qty), Column("PRODUCT", 100, 'L', _text('Description')),
+                    Column("UNIT ($)", 35, 'R', _money('Transfer Price (Unit)')), Column("TOTAL ($)", 35, 'R', _money('Transfer Total'))]
+
+CI_TEMPLATE = DocTemplate(
+    None, ("SHIPPER / EXPORTER:", 'addr_from'), ("CONSIGNEE (SHIP TO):", 'addr_ship'),
+    ["Invoice #: {inv_num}", "Date: {inv_date}", "Currency: USD"], ("IMPORTER OF RECORD:", 'addr_to'),
+    [Column("QTY", 10, 'C', _qty), Column("DESCRIPTION", 65, 'L', _text('Description')), Column("HTS #", 22, 'C', _text('HTS Code', '')),
+     Column("FDA", 20, 'C', _text('FDA Code', '')), Column("ORIGIN", 12, 'C', _text('country_of_origin', 'CA')), Column("UNIT WT", 18, 'C', _unit_weight),
+     Column("UNIT ($)", 18, 'R', _money('Transfer Price (Unit)')), Column("TOTAL ($)", 25, 'R', _money('Transfer Total'))],
+    _total_row("TOTAL VALUE (USD):"), min_mid_y=60, notes_box=True)
+
+PO_TEMPLATE = DocTemplate(
+    "PURCHASE ORDER", ("FROM (BUYER):", 'addr_buyer'), ("SHIP TO:", 'addr_ship'),
+    ["Invoice #: {inv_num}", "Date: {inv_date}", "Currency: USD"], ("TO (VENDOR):", 'addr_vendor'),
+    _PRODUCT_COLUMNS, _total_row("TOTAL (USD):"))
+
+SI_TEMPLATE = DocTemplate(
+    "SALES INVOICE", ("SHIPPER / EXPORTER:", 'addr_from'), ("SHIP TO:", 'addr_ship'),
+    ["Invoice #: {inv_num}", "Date: {inv_date}", "Due Date: {inv_date}", "Currency: USD"], ("BILL TO:", 'addr_to'),
+    _PRODUCT_COLUMNS, _total_row("TOTAL AMOUNT DUE (USD):"))
+
+PL_TEMPLATE = DocTemplate(
+    "PACKING LIST", ("SHIPPER / EXPORTER:", 'addr_from'), ("SHIP TO:", 'addr_ship'),
+    ["Packing List #: {inv_num}", "Date: {inv_date}"], ("BILL TO:", 'addr_to'),
+    [Column("QTY", 30, 'C', _qty), Column("PRODUCT", 160, 'L', _text('Product Name'))], _carton_total)
+
+def _draw_static_header(pdf, t, title, addresses, notes):
+    # Title and address blocks, leaving the cursor where the table starts; returns the y of the address row
+    pdf.set_font('Helvetica', 'B', 20); pdf.cell(0, 10, title, 0, 1, 'C'); pdf.ln(5)
+    pdf.set_font("Helvetica", '', 9); y_start = pdf.get_y()
+    addr_left, addr_mid, addr_low = addresses
+    pdf.set_xy(10, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, t.left[0], 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_left)
+    pdf.set_xy(90, y_start); pdf.set_font("Helvetica", 'B', 10); pdf.cell(70, 5, t.middle[0], 0, 1); pdf.set_xy(90, pdf.get_y()); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(70, 4, addr_mid)
+    y_numbers = y_start
+    for _ in t.number_lines: y_numbers += 6  # the number block (drawn per document) ends here
+    y_mid = max(y_numbers, t.min_mid_y) + 10; pdf.set_xy(10, y_mid); pdf.set_font("Helvetica", 'B', 10); pdf.cell(80, 5, t.lower[0], 0, 1); pdf.set_x(10); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(80, 4, addr_low)
+    if t.notes_box:
+        pdf.set_fill_color(245, 245, 245); pdf.rect(100, y_mid, 95, 30, 'F')
+        pdf.set_xy(102, y_mid + 2); pdf.set_font("Helvetica", 'B', 9); pdf.cell(50, 5, "NOTES / BROKER / FDA:", 0, 1); pdf.set_xy(102, pdf.get_y()); pdf.set_font("Helvetica", '', 8); pdf.multi_cell(90, 4, notes)
+    pdf.set_y(y_mid + 35)
+    return y_start
+
+@functools.lru_cache(maxsize=32)
+def _static_header(t, title, addresses, notes):
+    # The static header laid out on a scratch page: (snapshot, fonts it registered, y of the address row)
+    pdf = ProInvoice(); pdf.add_page(); pdf.set_auto_page_break(auto=False)
+    y_start = _draw_static_header(pdf, t, title, addresses, notes)
+    return PageSnapshot(pdf, 1), list(pdf.fonts.values()), y_start
+
+def _replay_static_header(pdf, t, title, addresses, notes):
+    # Replays the cached static header as a new page; returns the y of its address row, or None
+    # when this pdf can't take it. The replayed stream names fonts by number, so the pdf must number
+    # them the same way (it always does when the header opens the document).
+    snapshot, fonts, y_start = _static_header(t, title, addresses, notes)
+    if [f.fontkey for f in fonts[:len(pdf.fonts)]] != list(pdf.fonts): return None
+    for font in fonts: pdf.fonts.setdefault(font.fontkey, font)
+    snapshot.replay(pdf); pdf.set_auto_page_break(auto=False)
+    return y_start
+
+def _draw_header(pdf, t, fields):
+    title = t.title or fields['title']
+    addresses = tuple(fields[key] for _, key in (t.left, t.middle, t.lower))
+    notes = fields.get('notes') if t.notes_box else None
+    y_start = _replay_static_header(pdf, t, title, addresses, notes)
+    if y_start is None:
+        pdf.add_page(); pdf.set_auto_page_break(auto=False)
+        y_start = _draw_static_header(pdf, t, title, addresses, notes)
+    y_table = pdf.get_y()
+    first, *rest = [line.format(**fields) for line in t.number_lines]
+    pdf.set_xy(160, y_start); pdf.set_font("Helvetica", 'B', 12); pdf.cell(40, 6, first, 0, 1, 'R')
+    pdf.set_font("Helvetica", '', 10)
+    for line in rest: pdf.set_x(160); pdf.cell(40, 6, line, 0, 1, 'R')
+    pdf.set_y(y_table)
+
+def _draw_table_header(pdf, t):
+    pdf.set_font("Helvetica", 'B', 7); pdf.set_fill_color(220, 220, 220)
+    for c in t.columns: pdf.cell(c.width, 8, c.header, 1, 0, 'C', fill=True)
+    pdf.ln(); pdf.set_font("Helvetica", '', 7)
+
+def _cell_lines(pdf, txt, width, n):
+    # The lines of a table cell measured as n lines, or None to leave the cell to multi_cell()
+    if '\r' in txt: return None
+    if n == 1: return (txt,)
+    return text_metrics.wrapped_lines(pdf, txt, width)
+
+def draw_table(pdf, t, df, line_h=5, page_end=270):
+    # The order lines as bordered rows, each as tall as its longest cell; a row that would cross
+    # page_end starts a new page under a repeated header. Cells are drawn line by line with cell():
+    # a cell measured as one line needs no line breaking, and longer texts reuse the line breaks
+    # fpdf2 made the first time it saw them (text_metrics.wrapped_lines). The page comes out the
+    # same as with multi_cell(), minus its empty text operators for blank lines.
+    _draw_table_header(pdf, t)
+    texts = [c.texts(df) for c in t.columns]
+    counts = [text_metrics.column_line_counts(pdf, col, c.width - 2) for col, c in zip(texts, t.columns)]
+    cols = list(zip(t.xs, t.widths, [c.align for c in t.columns]))
+    for cells, lines in zip(zip(*texts), zip(*counts)):
+        row_h = max(lines) * line_h
+        if pdf.get_y() + row_h > page_end:
+            pdf.add_page(); _draw_table_header(pdf, t)
+        y = pdf.get_y()
+        for (x, w, align), txt, n in zip(cols, cells, lines):
+            pdf.set_xy(x, y)
+            wrapped = _cell_lines(pdf, txt, w, n)
+            if wrapped is None: pdf.multi_cell(w, line_h, txt, 0, align); continue
+            for line in wrapped: pdf.cell(w, line_h, line, align=align, new_x=XPos.LEFT, new_y=YPos.NEXT)
+        for x, w, _ in cols: pdf.rect(x, y, w, row_h)
+        pdf.set_y(y + row_h)
+
+def draw_document(pdf, t, df, **fields):
+    # One document of the family on new pages: header, table, then the template's summary
+    _draw_header(pdf, t, fields)
+    draw_table(pdf, t, df)
+    t.summary(pdf, t.widths, fields)
+
+# --- PDF DRAW FUNCTIONS ---
+
+def draw_ci_page(pdf, doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
+    draw_document(pdf, CI_TEMPLATE, df, title=doc_type, inv_num=inv_num, inv_date=inv_date, addr_from=addr_from, addr_to=addr_to, addr_ship=addr_ship, notes=notes, total_val=total_val)
+
+    pdf.ln(10)
+    pdf.set_font("Helvetica", '', 10)
+    pdf.cell(0, 5, "I declare that all information contained in this invoice to be true and correct.", 0, 1, 'L')
+    
+    pdf.ln(25) # Increased gap for signature
+    y_sig_line = pdf.get_y()
+    
+    pdf.set_font("Helvetica", 'B', 10)
+    pdf.cell(0, 5, signer_name, 0, 1, 'L')
+    
+    if sig_bytes:
+        signature_image(sig_bytes).place(pdf, x=10, y=y_sig_line - 20, w=40)
+
+def draw_bol_page(pdf, df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes):
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=False)
+    pdf.set_font('Helvetica', 'B', 18); pdf.cell(0, 10, "STRAIGHT BILL OF LADING", 0, 1, 'C'); pdf.ln(5)
+    pdf.set_font("Helvetica", '', 10); y_top = pdf.get_y()
+    pdf.set_xy(10, y_top); pdf.set_font("Helvetica", 'B', 10); pdf.cell(20, 6, "Date:", 0, 0); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, str(inv_date), 0, 0)
+    pdf.set_xy(130, y_top); pdf.set_font("Helvetica", 'B', 10); pdf.cell(30, 6, "BOL #:", 0, 0, 'R'); pdf.set_font("Helvetica", '', 10); pdf.cell(40, 6, hbol_number, 0, 1, 'R'); pdf.ln(10)
+    y_addr = pdf.get_y()
+    pdf.set_xy(10, y_addr); pdf.set_font("Helvetica", 'B', 11); pdf.cell(90, 6, "SHIP FROM (SHIPPER)", 1, 1, 'L', fill=False); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(0, 5, shipper_txt, 1, 'L'); pdf.ln(5)
+    pdf.set_x(10); pdf.set_font("Helvetica", 'B', 11); pdf.cell(0, 6, "SHIP TO (CONSIGNEE)", 1, 1, 'L', fill=False); pdf.set_font("Helvetica", '', 9); pdf.multi_cell(0, 5, consignee_txt, 1, 'L'); pdf.ln(5)
+    pdf.set_font("Helvetica", 'B', 11); pdf.cell(0, 6, f"CARRIER: {carrier_pdf_display}", 0, 1); pdf.ln(5)
+    w = [15, 25, 100, 30, 20]; headers = ["HM", "QTY", "DESCRIPTION OF COMMODITY", "WEIGHT", "CLASS"]
+    pdf.set_font("Helvetica", 'B', 9); pdf.set_fill_color(220, 220, 220)
+    for i, h in enumerate(headers): pdf.cell(w[i], 8, h, 1, 0, 'C', fill=True)
+    pdf.ln()
+    pdf.set_font("Helvetica", '', 9)
+    
+    def print_grid_row(data_list):
+        line_h = 5
+        max_lines = max(text_metrics.line_count(pdf, txt, w[i] - 2) for i, (txt, align) in enumerate(data_list))
+        row_h = max_lines * line_h
+        y_start = pdf.get_y(); x_start = 10
+        for i, (txt, align) in enumerate(data_list):
+            current_x = x_start + sum(w[:i])
+            pdf.set_xy(current_x, y_start); pdf.multi_cell(w[i], line_h, txt, 0, align)
+        pdf.set_xy(x_start, y_start)
+        for i in range(len(w)): pdf.rect(x_start + sum(w[:i]), y_start, w[i], row_h)
+        pdf.set_xy(x_start, y_start + row_h)
+
+    row1 = [("", 'C'), (f"{pallets} PLT", 'C'), ("ROASTED COFFEE (NMFC 056820)", 'L'), (f"{total_weight_lbs:.1f} lbs", 'R'), ("60", 'C')]
+    print_grid_row(row1)
+    row2 = [("", 'C'), (f"{cartons} CTN", 'C'), ("(Contains roasted coffee in bags)", 'L'), ("", 'R'), ("", 'C')]
+    print_grid_row(row2)
+    pdf.ln(10)
+    pdf.set_font("Helvetica", '', 8); legal = "RECEIVED, subject to the classifications and tariffs..."; pdf.multi_cell(0, 4, legal); pdf.ln(15)
+    y_sig = pdf.get_y(); pdf.line(10, y_sig, 90, y_sig); pdf.line(110, y_sig, 190, y_sig)
+    pdf.set_font("Helvetica", 'B', 8); pdf.set_xy(10, y_sig + 2); pdf.cell(80, 4, "SHIPPER SIGNATURE / DATE", 0, 0)
+    pdf.set_xy(110, y_sig + 2); pdf.cell(80, 4, "CARRIER SIGNATURE / DATE", 0, 1)
+    if sig_bytes:
+        signature_image(sig_bytes).place(pdf, x=15, y=y_sig-15, w=35)
+
+# --- INDIVIDUAL GENERATORS (WRAPPERS) ---
+@instrument.traced()
+def generate_ci_pdf(doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
+    pdf = ProInvoice(); pdf.alias_nb_pages()
+    draw_ci_page(pdf, doc_type, df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name)
+    return bytes(pdf.output())
+
+@instrument.traced()
+def generate_bol_pdf(df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes):
+    pdf = ReplayablePDF(); pdf.alias_nb_pages()
+    draw_copies(pdf, 2, draw_bol_page, df, inv_number, inv_date, shipper_txt, consignee_txt, carrier_pdf_display, hbol_number, pallets, cartons, total_weight_lbs, sig_bytes)
+    return bytes(pdf.output())
+
+# --- MASTER GENERATOR ---
+@instrument.traced()
+def generate_master_print_file(df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name, carrier_name, hbol, pallets, cartons, gross_weight):
+    pdf = ProInvoice(); pdf.alias_nb_pages()
+    
+    # 3 COPIES OF COMMERCIAL INVOICE (laid out once, then replicated)
+    draw_copies(pdf, 3, draw_ci_page, "COMMERCIAL INVOICE", df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name)
+    
+    # 2 COPIES OF BILL OF LADING
+    draw_copies(pdf, 2, draw_bol_page, df, inv_num, inv_date, addr_from, addr_ship, carrier_name, hbol, pallets, cartons, gross_weight, sig_bytes)
+        
+    return bytes(pdf.output())
+
+@instrument.traced()
+def generate_po_pdf(df, inv_num, inv_date, addr_buyer, addr_vendor, addr_ship, total_val):
+    pdf = ProInvoice(); pdf.alias_nb_pages()
+    draw_document(pdf, PO_TEMPLATE, df, inv_num=inv_num, inv_date=inv_date, addr_buyer=addr_buyer, addr_vendor=addr_vendor, addr_ship=addr_ship, total_val=total_val)
+    return bytes(pdf.output())
+
+@instrument.traced()
+def generate_pl_pdf(df, inv_num, inv_date, addr_from, addr_to, addr_ship, cartons):
+    pdf = ProInvoice(); pdf.alias_nb_pages()
+    draw_document(pdf, PL_TEMPLATE, df, inv_num=inv_num, inv_date=inv_date, addr_from=addr_from, addr_to=addr_to, addr_ship=addr_ship, cartons=cartons)
+    return bytes(pdf.output())
+
+@instrument.traced()
+def generate_si_pdf(df, inv_num, inv_date, addr_from, addr_to, addr_ship, notes, total_val, sig_bytes, signer_name):
+    pdf = ProInvoice(); pdf.alias_nb_pages()
+    draw_document(pdf, SI_TEMPLATE, df, inv_num=inv_num, inv_date=inv_date, addr_from=addr_from, addr_to=addr_to, addr_ship=addr_ship, total_val=total_val)
+    return bytes(pdf.output())
+
+@instrument.traced()
+def generate_customscity_csv(df, inv_number, inv_date, c_name, c_addr, c_city, c_state, c_zip, hbol_number, carrier_code):
+    weekday = inv_date.weekday()
+    days_to_add = 3 if weekday == 4 else (2 if weekday == 5 else 1)
+    est_arrival = inv_date + timedelta(days=days_to_add)
+    rows = []
+    for _, row in df.iterrows():
+        fda = str(row.get('FDA Code', '')).strip()
+        if not fda or fda.lower() == 'nan': continue
+        rows.append({
+            'Entry Type': '01', 'Reference Qualifier': 'BOL', 'Reference Number': '', 'Mode of Transport': '30', 'Bill Type': 'R',
+            'MBOL/TRIP Number': hbol_number, 'HBOL/ Shipment Control Number': hbol_number,
+            'Estimate Date of Arrival': est_arrival.strftime('%Y%m%d'), 'Time of Arrival': '18:00', 'US Port of Arrival': '0712',
+            'Equipment Number': '', 'Shipper Name': 'HOLISTIC ROASTERS', 'Shipper Address': '3780 RUE SAINT-PATRICK',
+            'Shipper City': 'MONTREAL', 'Shipper Country': 'CA', 'Consignee Name': c_name,
+            'Consignee Address': c_addr.replace('\n', ', '),
+            'Consignee City': c_city, 'Consignee State or Province': c_state, 'Consignee Postal Code': c_zip, 'Consignee Country': 'US',
+            'Description': row['Description'], 'Product ID': row.get('product_id', 'VARIOUS'), 'Carrier Name': carrier_code, 'Vessel Name': '',
+            'Voyage Trip Flight Number': hbol_number, 'Rail Car Number': ''
+        })
+    return pd.DataFrame(rows).to_csv(index=False).encode('utf-8')
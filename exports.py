@@ -0,0 +1,187 @@
+import zipfile
+import re
+from datetime import datetime, date
+
+import db
+import doc_cache
+
+# --- Company Defaults ---
+DEFAULT_SHIPPER = """Holistic Roasters inc.
+3780 St-Patrick
+Montreal, QC, Canada H4E 1A2
+BN/GST: 780810917RC0001
+TVQ: 1225279701TQ0001"""
+
+DEF_CONS_NAME = "Border Mail Depot"
+DEF_CONS_ADDR = "102 W. Service Road"
+DEF_CONS_CITY = "Champlain"
+DEF_CONS_STATE = "NY"
+DEF_CONS_ZIP = "12919"
+DEF_CONS_OTHER = "IRS# 461729644"
+DEFAULT_CONSIGNEE_FULL = "Border Mail Depot\n102 W. Service Road\nChamplain, NY 12919\nIRS# 461729644\nUnited States"
+
+DEFAULT_IMPORTER = """Holistic Roasters USA
+30 N Gould St, STE R
+Sheridan, WY 82801
+IRS/EIN: 32-082713200"""
+
+DEFAULT_NOTES = """CUSTOMS BROKER: Strix (Entry@strixsmart.com)
+HOLISTIC ROASTERS inc. Canada FDA #: 11638755492
+- ALL PRICES IN USD
+- Incoterms: EXW"""
+
+DEFAULT_HTS = "0901.21.00.20"
+DEFAULT_FDA = "31ADT01"
+SIGNER = "Dean Turner"
+
+# --- New Batches ---
+def create_batch(name):
+    # A fresh Active batch with the saved defaults; returns its id
+    saved_cons = db.get_setting('default_consignee')
+    def_cons = saved_cons.decode('utf-8') if saved_cons else DEFAULT_CONSIGNEE_FULL
+    saved_notes = db.get_setting('default_notes')
+    def_notes = saved_notes.decode('utf-8') if saved_notes else DEFAULT_NOTES
+    saved_carrier = db.get_setting('default_carrier')
+    def_carrier = saved_carrier.decode('utf-8') if saved_carrier else "GCYD (Green City Courier)"
+
+    new_data = {
+        "inv_number": f"{date.today().strftime('%Y%m%d')}1",
+        "inv_date": str(date.today()),
+        "discount": 75.0,
+        "cons_name": DEF_CONS_NAME,
+        "cons_addr": DEF_CONS_ADDR,
+        "cons_city": DEF_CONS_CITY,
+        "cons_state": DEF_CONS_STATE,
+        "cons_zip": DEF_CONS_ZIP,
+        "cons_other": DEF_CONS_OTHER,
+        "notes": def_notes,
+        "carrier": def_carrier,
+        "pallets": 1,
+        "cartons": 1,
+        "gross_weight": 0.0,
+        "lines_digest": None
+    }
+    return db.create_batch(name, new_data)
+
+# --- Batch Document Sets ---
+class DocumentSet:
+    # The export documents of one saved batch: file names, document cache fingerprint and the
+    # render jobs. Order lines are only read from the database when a job is actually needed, and
+    # the PDF stack (documents, fpdf) and the process pool are only imported then too.
+    def __init__(self, batch_id, batch_data, sig_bytes):
+        self.batch_id = batch_id
+        self.batch_data = batch_data
+        self.sig_bytes = sig_bytes
+        self.inv_number = batch_data.get('inv_number')
+        self.inv_date = datetime.strptime(batch_data.get('inv_date'), "%Y-%m-%d").date()
+        self.base_id = self.inv_number; self.hbol = f"HRUS{self.base_id}"
+
+        self.cons_name = batch_data.get('cons_name', DEF_CONS_NAME)
+        self.cons_addr = batch_data.get('cons_addr', DEF_CONS_ADDR)
+        self.cons_city = batch_data.get('cons_city', DEF_CONS_CITY)
+        self.cons_state = batch_data.get('cons_state', DEF_CONS_STATE)
+        self.cons_zip = batch_data.get('cons_zip', DEF_CONS_ZIP)
+        self.cons_other = batch_data.get('cons_other', DEF_CONS_OTHER)
+        lines = [self.cons_name, self.cons_addr, f"{self.cons_city}, {self.cons_state} {self.cons_zip}", self.cons_other, "United States"]
+        self.consignee_txt = "\n".join([L for L in lines if L and L.strip()])
+
+        self.notes = batch_data.get('notes')
+        self.carrier = batch_data.get('carrier')
+        self.pallets = batch_data.get('pallets')
+        self.cartons = batch_data.get('cartons')
+        self.gross_weight = batch_data.get('gross_weight')
+        self.carrier_code = "FX" if "FedEx" in self.carrier else "GCYD"
+
+        self._jobs = None
+        self.fingerprint = doc_cache.batch_fingerprint(batch_data, sig_bytes, DEFAULT_SHIPPER, DEFAULT_IMPORTER, SIGNER)
+        self.files = {
+            "master": (f"MasterPrint_{self.base_id}.pdf", "application/pdf"),
+            "customscity_csv": (f"CustomsCity_{self.base_id}.csv", "text/csv"),
+            "ci": (f"CI-HRUS{self.base_id}.pdf", "application/pdf"),
+            "pl": (f"PL-HRUS{self.base_id}.pdf", "application/pdf"),
+            "bol": (f"BOL-HRUS{self.base_id}.pdf", "application/pdf"),
+            "po": (f"PO-HRUS{self.base_id}.pdf", "application/pdf"),
+            "si": (f"SI-HRUS{self.base_id}.pdf", "application/pdf"),
+        }
+
+    @property
+    def has_lines(self):
+        return self.batch_data.get('lines_digest') is not None
+
+    def jobs(self):
+        if self._jobs is None: self._jobs = self._build_jobs()
+        return self._jobs
+
+    def _build_jobs(self):
+        import render_pool
+        from documents import generate_ci_pdf, generate_bol_pdf, generate_master_print_file, generate_po_pdf, generate_pl_pdf, generate_si_pdf, generate_customscity_csv
+        df = db.get_batch_lines(self.batch_id)
+        total_val = df['Transfer Total'].sum()
+        shipper, importer, cons, sig, d = DEFAULT_SHIPPER, DEFAULT_IMPORTER, self.consignee_txt, self.sig_bytes, self.inv_date
+        return {
+            "master": render_pool.RenderJob(generate_master_print_file, df, self.inv_number, d, shipper, importer, cons, self.notes, total_val, sig, SIGNER, self.carrier, self.hbol, self.pallets, self.cartons, self.gross_weight),
+            "customscity_csv": render_pool.RenderJob(generate_customscity_csv, df, self.inv_number, d, self.cons_name, self.cons_addr, self.cons_city, self.cons_state, self.cons_zip, self.hbol, self.carrier_code),
+            "ci": render_pool.RenderJob(generate_ci_pdf, "COMMERCIAL INVOICE", df, f"CI-HRUS{self.base_id}", d, shipper, importer, cons, self.notes, total_val, sig, SIGNER),
+            "pl": render_pool.RenderJob(generate_pl_pdf, df, f"PL-HRUS{self.base_id}", d, shipper, importer, cons, self.cartons),
+            "bol": render_pool.RenderJob(generate_bol_pdf, df, self.inv_number, d, shipper, cons, self.carrier, self.hbol, self.pallets, self.cartons, self.gross_weight, sig),
+            "po": render_pool.RenderJob(generate_po_pdf, df, f"PO-HRUS{self.base_id}", d, importer, shipper, cons, total_val),
+            "si": render_pool.RenderJob(generate_si_pdf, df, f"SI-HRUS{self.base_id}", d, shipper, importer, cons, self.notes, total_val, sig, SIGNER),
+        }
+
+    def lazy(self, name):
+        return doc_cache.LazyDocument(self.fingerprint, name, lambda: self.jobs()[name]())
+
+    def prefetch(self, names=None):
+        # Render the documents (all, or `names`) that aren't cached yet, in parallel
+        import render_pool
+        jobs = self.jobs()
+        return render_pool.prefetch_documents(self.fingerprint, {n: jobs[n] for n in names} if names else jobs)
+
+# --- Bulk Generation ---
+class BatchNotFound(LookupError):
+    def __init__(self, batch_ids):
+        super().__init__(f"Batch {', '.join(map(str, batch_ids))} not found")
+        self.batch_ids = batch_ids
+
+def _folder_name(batch_name, batch_id):
+    return f"{re.sub(r'[^A-Za-z0-9._ -]+', '_', batch_name or 'Batch').strip() or 'Batch'} (#{batch_id})"
+
+def write_bulk_zip(batch_ids, out, sig_bytes, progress=None, names=None):
+    # Every document of every batch into one ZIP written to `out` (any writable file object), one
+    # folder per batch. Documents missing from the cache are rendered for all batches at once on
+    # the process pool; progress(done, total, folder) is called as each batch's set completes.
+    # names limits the documents per batch. Batches without saved order lines are skipped; returns their folder names.
+    # Raises BatchNotFound, before anything is written, if any of batch_ids doesn't exist.
+    rows = [(batch_id, db.get_batch(batch_id)) for batch_id in batch_ids]
+    missing = [batch_id for batch_id, row in rows if row is None]
+    if missing: raise BatchNotFound(missing)
+    sets, skipped = [], []
+    for batch_id, row in rows:
+        docs = DocumentSet(batch_id, row['data'], sig_bytes)
+        folder = _folder_name(row['batch_name'], batch_id)
+        if docs.has_lines: sets.append((folder, docs))
+        else: skipped.append(folder)
+
+    import render_pool
+    remaining = {}
+    jobs = {}
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zf:
+        def add(i, name, data):
+            folder, docs = sets[i]
+            filename, mime = docs.files[name]
+            # fpdf2 already compresses PDF streams; only the CSV is worth deflating
+            zf.writestr(f"{folder}/{filename}", data, compress_type=zipfile.ZIP_STORED if mime == "application/pdf" else zipfile.ZIP_DEFLATED)
+            remaining[i] -= 1
+            if remaining[i] == 0 and progress: progress(sum(1 for n in remaining.values() if n == 0), len(sets), folder)
+
+        for i, (folder, docs) in enumerate(sets):
+            wanted = names or list(docs.files)
+            remaining[i] = len(wanted)
+            missing = set(doc_cache.missing_documents(docs.fingerprint, wanted))
+            for name in wanted:
+                if name in missing: jobs[(i, name)] = docs.jobs()[name]
+                else: add(i, name, doc_cache.cached_document(docs.fingerprint, name, lambda: docs.jobs()[name]()))
+        for (i, name), data in render_pool.render_documents(jobs):
+            doc_cache.put_document(f"{sets[i][1].fingerprint}:{name}", data)
+            add(i, name, data)
+    return skipped
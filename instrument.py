@@ -0,0 +1,135 @@
+import cProfile
+import functools
+import io
+import json
+import marshal
+import pstats
+import threading
+import time
+
+# --- Instrumentation ---
+# Named timing spans around the expensive steps (database reads, CSV ingest, consolidation,
+# document generation, mail). Recording is opt-in per session: the page script calls
+# begin(recorder) at the top of a rerun and end() at the bottom, and spans opened in between on
+# that thread are recorded. With no recorder active, span() hands back a shared no-op and traced
+# functions call straight through, so the cost when it's off is one thread-local lookup.
+# Spans in other threads (render pool workers, the mail worker) aren't recorded.
+
+class _ThreadState(threading.local):
+    recorder = None  # class default: reading it on a fresh thread doesn't raise
+
+_local = _ThreadState()
+
+class Recorder:
+    # One session's spans: those of the latest rerun, plus running totals per span name
+    def __init__(self):
+        self.spans = []           # (name, start offset s, duration s, depth, attrs) of the current rerun
+        self.totals = {}          # name -> [count, total s, max s]
+        self.reruns = 0
+        self.run_seconds = None
+        self.profile_next = False
+        self.profile_stats = None  # text report of the last profiled rerun
+        self.profile_dump = None   # the same profile as pstats data (open with snakeviz, pstats, ...)
+        self._profiler = None
+        self._started = None
+        self._depth = 0
+
+    def reset(self):
+        self.totals.clear()
+        self.reruns = 0
+
+    def add(self, name, start, duration, depth, attrs):
+        self.spans.append((name, start - self._started, duration, depth, attrs))
+        entry = self.totals.get(name)
+        if entry is None: self.totals[name] = [1, duration, duration]
+        else:
+            entry[0] += 1; entry[1] += duration
+            if duration > entry[2]: entry[2] = duration
+
+    def to_json(self):
+        return json.dumps({
+            'rerun_seconds': self.run_seconds,
+            'spans': [{'name': n, 'start': round(s, 6), 'seconds': round(d, 6), 'depth': depth, **attrs} for n, s, d, depth, attrs in self.spans],
+            'totals': {n: {'count': c, 'seconds': round(t, 6), 'max_seconds': round(m, 6)} for n, (c, t, m) in self.totals.items()},
+            'reruns': self.reruns,
+        }, indent=2)
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'attrs', 'start')
+
+    def __init__(self, recorder, name, attrs):
+        self.recorder = recorder
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.recorder._depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        self.recorder._depth -= 1
+        self.recorder.add(self.name, self.start, duration, self.recorder._depth, self.attrs)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, **attrs):
+    # with instrument.span("catalog.merge", rows=n): ...
+    recorder = _local.recorder
+    if recorder is None: return _NULL_SPAN
+    return _Span(recorder, name, attrs)
+
+def traced(name=None):
+    # Decorator: records every call of the function as a span (module.function by default)
+    def wrap(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _local.recorder
+            if recorder is None: return func(*args, **kwargs)
+            with _Span(recorder, span_name, {}): return func(*args, **kwargs)
+        return wrapper
+    return wrap
+
+# --- Rerun lifecycle ---
+def begin(recorder=None):
+    # Start recording a rerun into `recorder` on this thread (None: record nothing). A rerun cut short
+    # by st.rerun(), st.stop() or an exception never reached end() and is still attached here: finish
+    # it first, so its totals and profile are kept and nothing else is recorded into it.
+    if _local.recorder is not None: end()
+    if recorder is not None and recorder._profiler is not None:
+        recorder._profiler.disable(); recorder._profiler = None  # its rerun died with another thread
+    _local.recorder = recorder
+    if recorder is None: return
+    recorder.spans = []
+    recorder._depth = 0
+    recorder._started = time.perf_counter()
+    recorder.run_seconds = None
+    if recorder.profile_next:
+        recorder.profile_next = False
+        recorder._profiler = cProfile.Profile()
+        recorder._profiler.enable()
+
+def end():
+    # Finish the rerun started by begin(); returns its recorder
+    recorder = _local.recorder
+    _local.recorder = None
+    if recorder is None: return None
+    recorder.run_seconds = time.perf_counter() - recorder._started
+    recorder.reruns += 1
+    if recorder._profiler is not None:
+        profiler, recorder._profiler = recorder._profiler, None
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(40)
+        recorder.profile_stats = out.getvalue()
+        profiler.create_stats()
+        recorder.profile_dump = marshal.dumps(profiler.stats)  # what Profile.dump_stats would write
+    return recorder
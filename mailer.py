@@ -0,0 +1,200 @@
+import threading
+import json
+import time
+import os
+
+import db
+import doc_cache
+import instrument
+
+# --- Outbound Mail Queue ---
+# Email Center sends are queued in the `outbox` table (see db.MIGRATIONS) and delivered by one
+# background worker thread per process, so the page never waits on SMTP. The worker keeps each
+# sender's SMTP session open between messages, retries transient failures with exponential backoff
+# and records a status per message for the UI to poll. Attachments are stored as document cache
+# keys, written to the cache together with the message, and the cache doesn't evict them while the
+# message is pending; they are read back only when it goes out. Passwords are never written to the
+# database: they stay in this process's memory until the message is delivered or given up on.
+# smtplib, ssl and email are imported by the worker when it first sends, not at app startup.
+
+SMTP_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', '1') != '0'  # '0' for a local stand-in: python -m aiosmtpd -n -l localhost:8025
+SMTP_TIMEOUT = 30
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 5    # waits of 5, 10, 20, 40 s between attempts
+IDLE_SECONDS = 60         # an unused SMTP session is closed after this long
+
+PENDING = ('queued', 'sending')
+
+class PermanentError(Exception):
+    # Delivery can't succeed by retrying (bad credentials, refused recipient, missing attachment)
+    pass
+
+_passwords = {}  # message id -> password, for messages queued by this process
+_wake = threading.Event()
+_worker = None
+_worker_lock = threading.Lock()
+
+# --- Queue ---
+@instrument.traced()
+def enqueue(sender, password, recipient, subject, body, attachments, batch_id=None):
+    # attachments: [(filename, mime, document cache key, bytes)]; the row keeps (filename, mime, key)
+    now = time.time()
+    with db.get_db().transaction() as c:
+        for filename, mime, key, data in attachments: doc_cache.store_document(c, key, data)
+        attachments = [(filename, mime, key) for filename, mime, key, data in attachments]
+        c.execute("""INSERT INTO outbox (batch_id, sender, recipient, subject, body, attachments, smtp_host, smtp_port,
+                                         status, attempts, next_attempt, created_at, updated_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued', 0, ?, ?, ?)""",
+                  (batch_id, sender, recipient, subject, body, json.dumps(attachments), SMTP_HOST, SMTP_PORT, now, now, now))
+        msg_id = c.lastrowid
+        _passwords[msg_id] = password  # before commit: the worker can't see the row without its password
+    start_worker()
+    _wake.set()
+    return msg_id
+
+def batch_messages(batch_id, limit=5):
+    # [(id, recipient, subject, status, attempts, last_error)] of a batch, newest first
+    with db.get_db().cursor() as c:
+        c.execute("""SELECT id, recipient, subject, status, attempts, last_error FROM outbox
+                     WHERE batch_id=? ORDER BY id DESC LIMIT ?""", (batch_id, limit))
+        return c.fetchall()
+
+def _claim(now):
+    # Take the next due message queued by this process and mark it as being sent
+    ids = list(_passwords)
+    if not ids: return None
+    marks = ",".join("?" * len(ids))
+    with db.get_db().transaction() as c:
+        c.execute(f"""SELECT id, sender, recipient, subject, body, attachments, smtp_host, smtp_port, attempts FROM outbox
+                      WHERE status='queued' AND next_attempt<=? AND id IN ({marks}) ORDER BY next_attempt, id LIMIT 1""", [now] + ids)
+        row = c.fetchone()
+        if row: c.execute("UPDATE outbox SET status='sending', attempts=attempts+1, updated_at=? WHERE id=?", (now, row[0]))
+    return row
+
+def _next_due():
+    ids = list(_passwords)
+    if not ids: return None
+    with db.get_db().cursor() as c:
+        c.execute(f"SELECT MIN(next_attempt) FROM outbox WHERE status='queued' AND id IN ({','.join('?' * len(ids))})", ids)
+        return c.fetchone()[0]
+
+def _finish(msg_id, status, error=None, next_attempt=None):
+    with db.get_db().transaction() as c:
+        c.execute("UPDATE outbox SET status=?, last_error=?, next_attempt=COALESCE(?, next_attempt), updated_at=? WHERE id=?",
+                  (status, error, next_attempt, time.time(), msg_id))
+    if status not in PENDING: _passwords.pop(msg_id, None)
+
+def _abandon_orphans():
+    # Pending messages from an earlier process can't be sent: their passwords went with it
+    ids = list(_passwords)
+    with db.get_db().transaction() as c:
+        c.execute(f"""UPDATE outbox SET status='failed', last_error='Interrupted by an app restart, please send again', updated_at=?
+                      WHERE status IN ('queued', 'sending') AND id NOT IN ({','.join('?' * len(ids))})""", [time.time()] + ids)
+
+def _after_restore(database):
+    # The restored outbox is another database's: forget this process's pending passwords and fail whatever it left pending
+    _passwords.clear()
+    _abandon_orphans()
+
+db.on_restore(_after_restore)
+
+# --- SMTP Sessions ---
+class SessionPool:
+    # Open SMTP sessions by (host, port, sender), checked with NOOP before reuse
+    def __init__(self):
+        self.sessions = {}
+
+    def get(self, host, port, sender, password):
+        import smtplib, ssl
+        key = (host, port, sender)
+        entry = self.sessions.get(key)
+        if entry is not None:
+            try:
+                if entry[0].noop()[0] == 250:
+                    entry[1] = time.time()
+                    return entry[0]
+            except (smtplib.SMTPException, OSError): pass
+            self.drop(key)
+        smtp = smtplib.SMTP(host, port, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS: smtp.starttls(context=ssl.create_default_context())
+            smtp.ehlo_or_helo_if_needed()  # the constructor sends no EHLO and starttls() forgets the extensions
+            if password and smtp.has_extn('auth'): smtp.login(sender, password)
+        except BaseException:
+            smtp.close()
+            raise
+        self.sessions[key] = [smtp, time.time()]
+        return smtp
+
+    def drop(self, key):
+        entry = self.sessions.pop(key, None)
+        if entry is None: return
+        import smtplib
+        try: entry[0].quit()
+        except (smtplib.SMTPException, OSError): entry[0].close()
+
+    def close_idle(self, now):
+        for key, (smtp, last_used) in list(self.sessions.items()):
+            if now - last_used > IDLE_SECONDS: self.drop(key)
+
+# --- Delivery ---
+def build_message(sender, recipient, subject, body, attachments):
+    from email.message import EmailMessage
+    msg = EmailMessage()
+    msg['From'] = sender
+    msg['To'] = recipient
+    msg['Subject'] = subject
+    msg.set_content(body)
+    for filename, mime, key in attachments:
+        data = doc_cache.get_document(key)
+        if data is None: raise PermanentError(f"{filename} is no longer in the document cache")
+        maintype, subtype = mime.split('/', 1)
+        msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
+    return msg
+
+def _is_permanent(e):
+    import smtplib
+    if isinstance(e, (PermanentError, smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError)): return True
+    return isinstance(e, smtplib.SMTPResponseException) and 500 <= e.smtp_code < 600
+
+def _deliver(row, pool):
+    msg_id, sender, recipient, subject, body, attachments, host, port, attempts = row
+    attempts += 1
+    try:
+        msg = build_message(sender, recipient, subject, body, json.loads(attachments))
+        smtp = pool.get(host, port, sender, _passwords.get(msg_id))
+        smtp.send_message(msg)  # serialized straight to bytes (no intermediate str copy as with as_string)
+    except Exception as e:
+        if not isinstance(e, PermanentError): pool.drop((host, port, sender))
+        if _is_permanent(e) or attempts >= MAX_ATTEMPTS: _finish(msg_id, 'failed', str(e))
+        else: _finish(msg_id, 'queued', str(e), time.time() + RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        return
+    _finish(msg_id, 'sent')
+
+def _run():
+    pool = SessionPool()
+    _abandon_orphans()
+    while True:
+        try:
+            _wake.clear()
+            row = _claim(time.time())
+            if row is not None:
+                _deliver(row, pool)
+                continue
+            now = time.time()
+            pool.close_idle(now)
+            due = _next_due()
+            _wake.wait(IDLE_SECONDS if due is None else min(IDLE_SECONDS, max(0.05, due - now)))
+        except Exception as e:
+            # Never let the worker die (e.g. the database is briefly closed during a restore)
+            print(f"Mail worker error: {e}")
+            time.sleep(1)
+
+def start_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="mail-worker", daemon=True)
+            _worker.start()
@@ -0,0 +1,155 @@
+import pandas as pd
+import uuid
+
+import instrument
+
+# --- Order Export Ingestion ---
+# Storefront exports carry every line item of every country and item type, but a batch only needs
+# the US product lines. The CSV is streamed in chunks, parsing just the columns used below and
+# filtering as it goes, so memory follows the kept rows rather than the size of the export.
+
+CHUNK_ROWS = 50_000
+ORDER_COLUMNS = ['SO #', 'Name', 'Order Name', 'Order Number']  # first one present identifies the order
+SALES_COLUMNS = ['Variant code / SKU', 'Item variant', 'Quantity', 'Price per unit']
+
+@instrument.traced()
+def read_us_product_lines(file, chunk_rows=CHUNK_ROWS):
+    # Returns (sales_data, unique_orders_count), or None when the file isn't a storefront export
+    header = pd.read_csv(file, nrows=0).columns
+    file.seek(0)
+    if 'Ship to country' not in header: return None
+    missing = [col for col in SALES_COLUMNS if col not in header]
+    if missing: raise KeyError(f"{missing} not in the CSV")
+
+    order_col = next((col for col in ORDER_COLUMNS if col in header), None)
+    filter_cols = ['Ship to country'] + (['Item type'] if 'Item type' in header else [])
+    usecols = list(dict.fromkeys(filter_cols + SALES_COLUMNS + ([order_col] if order_col else [])))
+    dtypes = {col: str for col in usecols if col != 'Quantity'}  # text as-is: no per-chunk type guessing
+
+    parts = []
+    order_ids = set()
+    for chunk in pd.read_csv(file, usecols=usecols, dtype=dtypes, chunksize=chunk_rows):
+        keep = chunk['Ship to country'] == 'United States'
+        if 'Item type' in chunk.columns: keep &= chunk['Item type'] == 'product'
+        chunk = chunk[keep]
+        if chunk.empty: continue
+        if order_col: order_ids.update(chunk[order_col].dropna())
+        parts.append(chunk[SALES_COLUMNS])
+
+    sales_data = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=SALES_COLUMNS)
+    sales_data['Variant code / SKU'] = sales_data['Variant code / SKU'].fillna('').astype(str).str.strip()
+    sales_data['CSV_Price'] = pd.to_numeric(sales_data['Price per unit'], errors='coerce').fillna(0)
+    return sales_data, (len(order_ids) if order_col else 1)
+
+# --- Enrichment & Consolidation ---
+CONSOLIDATION_KEYS = ['product_id', 'HTS Code', 'Weight (lbs)', 'country_of_origin', 'FDA Code']
+
+@instrument.traced()
+def enrich_order_lines(sales_data, catalog, default_hts, default_fda):
+    # Attach catalog data to each order line. catalog: db.CatalogSnapshot (or None/empty)
+    if catalog is not None and not catalog.empty:
+        merged = sales_data.join(catalog.by_sku, on='Variant code / SKU').reset_index(drop=True)
+        merged['Product Name'] = merged['product_name'].fillna(merged['Item variant'])
+        merged['Description'] = merged['description'].fillna(merged['Product Name'])
+        merged['HTS Code'] = merged['hts_code'].fillna(default_hts)
+        merged['FDA Code'] = merged['fda_code'].fillna(default_fda)
+        merged['Weight (lbs)'] = merged['weight_lbs'].fillna(0.0)
+        merged['unit_price'] = pd.to_numeric(merged['unit_price'], errors='coerce').fillna(0.0)
+        merged['Transfer Price (Unit)'] = merged['unit_price'].where(merged['unit_price'] > 0, merged['CSV_Price'])
+        if 'country_of_origin' not in merged.columns: merged['country_of_origin'] = "CA"
+        if 'product_id' not in merged.columns: merged['product_id'] = merged['Variant code / SKU']
+        return merged
+    sales_data = sales_data.copy()
+    sales_data['Product Name'] = sales_data['Item variant']
+    sales_data['Description'] = sales_data['Item variant']
+    sales_data['HTS Code'] = default_hts
+    sales_data['FDA Code'] = default_fda
+    sales_data['Weight (lbs)'] = 0.0
+    sales_data['Transfer Price (Unit)'] = sales_data['CSV_Price']
+    sales_data['country_of_origin'] = "CA"
+    sales_data['product_id'] = sales_data['Variant code / SKU']
+    return sales_data
+
+def _sku_labels(group_ids, skus):
+    # Per group: its distinct SKUs in order of appearance joined with ', ' when there are one or two, else 'VARIOUS'
+    distinct = pd.DataFrame({'g': group_ids, 'sku': skus})
+    distinct = distinct[distinct['g'] >= 0].drop_duplicates()
+    pos = distinct.groupby('g').cumcount()
+    first = distinct['sku'][pos == 0].set_axis(distinct['g'][pos == 0])
+    second = distinct['sku'][pos == 1].set_axis(distinct['g'][pos == 1]).reindex(first.index)
+    count = pos.groupby(distinct['g']).size().reindex(first.index)
+    labels = first.astype(object).where(second.isna(), first.astype(str) + ', ' + second.astype(str))
+    return labels.where(count < 3, 'VARIOUS').sort_index()
+
+@instrument.traced()
+def consolidate_order_lines(df):
+    # One row per customs line (CONSOLIDATION_KEYS), quantities and totals summed
+    df = df.assign(**{
+        'Transfer Total': df['Quantity'] * df['Transfer Price (Unit)'],
+        'FDA Code': df['FDA Code'].fillna("N/A"),
+        'country_of_origin': df['country_of_origin'].fillna("N/A"),
+        'product_id': df['product_id'].fillna("N/A"),
+    })
+    grouped = df.groupby(CONSOLIDATION_KEYS)
+    consolidated = grouped.agg({
+        'Quantity': 'sum',
+        'Transfer Total': 'sum',
+        'Product Name': 'first',
+        'Description': 'first',
+    }).reset_index()
+    consolidated['Variant code / SKU'] = _sku_labels(grouped.ngroup().to_numpy(), df['Variant code / SKU'].to_numpy()).to_numpy()
+    consolidated['Transfer Price (Unit)'] = consolidated['Transfer Total'] / consolidated['Quantity']
+    return consolidated
+
+# --- Editable Order Model ---
+def _nz(x):
+    return 0.0 if x is None or pd.isna(x) else float(x)
+
+class OrderModel:
+    # The consolidated lines of one batch for one order source (upload or saved orders) and catalog
+    # snapshot, kept across reruns. Grid edits arrive as st.data_editor deltas, and totals are updated
+    # from the changed rows only instead of re-reading, re-merging and re-aggregating everything.
+    def __init__(self, source_key, catalog, consolidated, unique_orders_count=1):
+        self.source_key = source_key
+        self.catalog = catalog
+        self.consolidated = consolidated
+        self.unique_orders_count = unique_orders_count
+        self.token = uuid.uuid4().hex[:12]  # widget key suffix: a new source starts with a fresh editor
+        self._line_totals = consolidated['Transfer Total'].to_numpy(dtype=float)
+        self._line_weights = (consolidated['Quantity'] * consolidated['Weight (lbs)']).to_numpy(dtype=float)
+        self.total_value = float(pd.Series(self._line_totals).sum())
+        self.calc_weight = float(pd.Series(self._line_weights).sum())
+
+    def matches(self, source_key, catalog):
+        return self.source_key == source_key and self.catalog is catalog
+
+    def apply_edits(self, edited_df, editor_state):
+        # editor_state: st.session_state[editor key] ({'edited_rows', 'added_rows', 'deleted_rows'}).
+        # Recomputes 'Transfer Total' on rows whose quantity or unit price changed (unless the total
+        # itself was typed in) and returns (edited_df, total value, calculated weight).
+        editor_state = editor_state or {}
+        deleted = set(editor_state.get('deleted_rows', []))
+        total = self.total_value - sum(_nz(self._line_totals[pos]) for pos in deleted)
+        weight = self.calc_weight - sum(_nz(self._line_weights[pos]) for pos in deleted)
+        fixes = {}
+
+        def line_values(label, recompute):
+            row = edited_df.loc[label]
+            line_total = row['Transfer Total']
+            if recompute: line_total = fixes[label] = _nz(row['Quantity']) * _nz(row['Transfer Price (Unit)'])
+            return _nz(line_total), _nz(row['Quantity']) * _nz(row['Weight (lbs)'])
+
+        for pos, changes in editor_state.get('edited_rows', {}).items():
+            pos = int(pos)
+            if pos in deleted: continue
+            recompute = bool({'Quantity', 'Transfer Price (Unit)'} & changes.keys()) and 'Transfer Total' not in changes
+            line_total, line_weight = line_values(pos, recompute)
+            total += line_total - _nz(self._line_totals[pos])
+            weight += line_weight - _nz(self._line_weights[pos])
+        for label in edited_df.index[len(edited_df) - len(editor_state.get('added_rows', [])):]:
+            line_total, line_weight = line_values(label, pd.isna(edited_df.at[label, 'Transfer Total']))
+            total += line_total
+            weight += line_weight
+
+        if fixes: edited_df.loc[list(fixes), 'Transfer Total'] = list(fixes.values())
+        return edited_df, total, weight
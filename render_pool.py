@@ -0,0 +1,128 @@
+import pandas as pd
+import concurrent.futures
+import multiprocessing
+import hashlib
+import pickle
+import threading
+import contextlib
+import atexit
+import sys
+import os
+
+import doc_cache
+import instrument
+
+# --- Parallel Document Generation ---
+# The generate_* functions are independent CPU-bound fpdf2 jobs, so a full document set is fanned
+# out over a process pool. Each DataFrame argument is pickled once in the parent; the same bytes
+# still travel with every job (the pool outlives any one batch, so they can't go in initargs), but
+# each worker unpickles them only once per batch and reuses the frame for the jobs that follow.
+
+MAX_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+class RenderJob:
+    # One generate_* call. `func` must be a module-level function (e.g. documents.generate_ci_pdf)
+    # so it can be sent to a worker process by reference.
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        return self.func(*self.args)
+
+class _FramePayload:
+    def __init__(self, df):
+        self.data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        self.digest = hashlib.sha1(self.data).hexdigest()
+
+_executor = None
+_executor_lock = threading.Lock()
+_main_lock = threading.Lock()  # sessions submit from their own script threads
+
+def get_executor():
+    # One pool per process, reused across reruns. 'spawn' keeps workers clear of the
+    # Streamlit server's threads and locks.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _reset_executor(wait=False):
+    global _executor
+    with _executor_lock:
+        if _executor is not None: _executor.shutdown(wait=wait, cancel_futures=True)
+        _executor = None
+
+atexit.register(_reset_executor, True)
+
+@contextlib.contextmanager
+def _plain_main():
+    # Streamlit installs the page script as __main__, and spawned workers re-import __main__ while
+    # bootstrapping (which would run the whole UI). Workers are started on submit, so point __main__
+    # at this side-effect-free module while jobs are being submitted. Serialized, so two sessions
+    # submitting at once can't restore each other's swap and leave render_pool installed as __main__.
+    with _main_lock:
+        main = sys.modules.get('__main__')
+        sys.modules['__main__'] = sys.modules[__name__]
+        try: yield
+        finally: sys.modules['__main__'] = main
+
+# --- Worker side ---
+_worker_frames = {}
+
+def _load_frame(payload):
+    df = _worker_frames.get(payload.digest)
+    if df is None:
+        df = pickle.loads(payload.data)
+        _worker_frames.clear()  # only the batch currently being rendered is worth keeping
+        _worker_frames[payload.digest] = df
+    return df
+
+def _run_job(func, args):
+    args = [_load_frame(a) if isinstance(a, _FramePayload) else a for a in args]
+    return func(*args)
+
+# --- Parent side ---
+def render_documents(jobs):
+    # jobs: {name: RenderJob}. Yields (name, bytes) in completion order.
+    if not jobs: return
+    if MAX_WORKERS == 1 or len(jobs) == 1:
+        for name, job in jobs.items(): yield name, job()
+        return
+
+    payloads = {}
+    specs = {}
+    for name, job in jobs.items():
+        args = []
+        for a in job.args:
+            if isinstance(a, pd.DataFrame):
+                if id(a) not in payloads: payloads[id(a)] = _FramePayload(a)
+                a = payloads[id(a)]
+            args.append(a)
+        specs[name] = (job.func, tuple(args))
+
+    pending = dict(jobs)
+    try:
+        executor = get_executor()
+        with _plain_main():
+            futures = {executor.submit(_run_job, func, args): name for name, (func, args) in specs.items()}
+        for fut in concurrent.futures.as_completed(futures):
+            name = futures[fut]
+            data = fut.result()
+            del pending[name]
+            yield name, data
+    except (concurrent.futures.process.BrokenProcessPool, OSError) as e:
+        # No usable pool (sandboxed host, killed worker): finish the remaining jobs in-process
+        print(f"Render pool unavailable, rendering serially: {e}")
+        _reset_executor()
+        for name, job in list(pending.items()):
+            yield name, job()
+
+@instrument.traced()
+def prefetch_documents(fingerprint, jobs):
+    # Render every document of a set that isn't in the document cache yet, in parallel
+    missing = doc_cache.missing_documents(fingerprint, list(jobs))
+    for name, data in render_documents({n: jobs[n] for n in missing}):
+        doc_cache.put_document(f"{fingerprint}:{name}", data)
+    return missing
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import db
+
+@pytest.fixture
+def db_globals(monkeypatch):
+    # Whatever a test does to db's provider, default connection or DB_PATH is undone afterwards
+    for name in ('_provider', '_default', 'DB_PATH'): monkeypatch.setattr(db, name, getattr(db, name))
+
+@pytest.fixture
+def use_database(db_globals):
+    # use_database(path) opens a Database there and makes it the one db.get_db() returns
+    opened = []
+    def use(path):
+        database = db.Database(str(path))
+        opened.append(database)
+        db.set_provider(lambda: database)
+        return database
+    yield use
+    for database in opened: database.close()
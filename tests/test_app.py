@@ -0,0 +1,41 @@
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import db
+import exports
+import mailer
+
+APP = __file__.rsplit("/tests/", 1)[0] + "/app.py"
+
+@pytest.fixture
+def at(tmp_path, monkeypatch, db_globals):
+    # The page script installs its own provider (open_database, on db.DB_PATH); db_globals undoes it
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "app.db"))
+    monkeypatch.setattr(mailer, "start_worker", lambda: None)
+    st.cache_resource.clear()  # open_database is process-wide; point it at this test's file
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.run()
+    yield at
+    db.get_db().close()
+    st.cache_resource.clear()
+
+def test_submitted_dialogs_show_the_carrier(at):
+    batch_id = exports.create_batch("Dialogs")
+    at.session_state[f"batch_{batch_id}_status"] = "Submitted"
+    for stage, text in (("step3", "Plan to email these documents to: **GCYD (Green City Courier)**"),
+                        ("step5", "Did you send the email to **GCYD (Green City Courier)**")):
+        at.session_state[f"dialog_stage_{batch_id}"] = stage
+        at.run()
+        assert not at.exception
+        assert any(text in e.value for e in [*at.info, *at.markdown])
+
+def test_bulk_zip_picks_batches_by_id(at):
+    first, second = exports.create_batch("Month-End"), exports.create_batch("Month-End")
+    at.run()
+    picker = at.multiselect(key="bulk_batches")
+    assert picker.options == [f"Month-End (#{second})", f"Month-End (#{first})"]
+    picker.set_value([second]).run()
+    at.button[1].click().run()
+    assert not at.exception
+    assert at.warning[0].value == f"Skipped (no saved orders): Month-End (#{second})"
@@ -0,0 +1,34 @@
+import io
+import sqlite3
+
+import pytest
+
+import backup
+import db
+
+def _old_backup(path, batch_data):
+    # A schema-version-1 database file, as older versions of the app backed it up
+    conn = sqlite3.connect(path, isolation_level=None)
+    c = conn.cursor()
+    db._migration_1(c)
+    c.execute("CREATE TABLE schema_migrations (version INTEGER PRIMARY KEY, applied_at TEXT)")
+    c.execute("INSERT INTO schema_migrations VALUES (1, '2025-01-01T00:00:00')")
+    c.execute("INSERT INTO batches (batch_name, status, created_at, updated_at, data) VALUES ('Old', 'Active', '', '', ?)", (batch_data,))
+    conn.close()
+    with open(path, 'rb') as f: return io.BytesIO(f.read())
+
+@pytest.fixture
+def live(tmp_path, use_database):
+    database = use_database(tmp_path / "live.db")
+    db.create_batch("Live", {'inv_number': '1'})
+    return database
+
+def test_restore_migrates_an_old_backup(tmp_path, live):
+    backup.restore(_old_backup(str(tmp_path / "old.db"), '{"inv_number": "7"}'), live)
+    assert list(db.list_batches()['batch_name']) == ['Old']
+
+def test_failed_migration_is_a_restore_error(tmp_path, live):
+    upload = _old_backup(str(tmp_path / "old.db"), 'not json')
+    with pytest.raises(backup.RestoreError):
+        backup.restore(upload, live)
+    assert list(db.list_batches()['batch_name']) == ['Live']
@@ -0,0 +1,15 @@
+import os
+
+import cli
+import db
+
+def test_zip_of_unknown_batch_fails(tmp_path, capsys, use_database):
+    path = str(tmp_path / "cli.db")
+    use_database(path)
+    batch_id = db.create_batch("Known", {'inv_number': '1', 'inv_date': '2026-01-31', 'carrier': 'GCYD', 'lines_digest': None})
+    out = str(tmp_path / "month.zip")
+    assert cli.main(["--db", path, "batch", str(batch_id), "99", "--zip", out]) == 1
+    assert "Batch 99 not found" in capsys.readouterr().err
+    assert not os.path.exists(out)
+    # Without --zip the same ids fail the same way
+    assert cli.main(["--db", path, "batch", str(batch_id), "99", "--out", str(tmp_path / "docs")]) == 1
@@ -0,0 +1,22 @@
+import pytest
+
+import doc_cache
+
+@pytest.fixture
+def database(tmp_path, use_database):
+    return use_database(tmp_path / "cache.db")
+
+def test_reads_leave_the_database_unchanged(database):
+    doc_cache.put_document("a", b"a" * 100)
+    before = database.change_key()
+    assert doc_cache.get_document("a") == b"a" * 100
+    assert doc_cache.get_document("missing") is None
+    assert database.change_key() == before
+
+def test_reads_still_count_for_eviction(database):
+    doc_cache.put_document("old", b"o" * 100, max_bytes=250)
+    doc_cache.put_document("new", b"n" * 100, max_bytes=250)
+    doc_cache.get_document("old")  # now the most recently used
+    doc_cache.put_document("third", b"t" * 100, max_bytes=250)
+    assert doc_cache.get_document("new") is None
+    assert doc_cache.get_document("old") == b"o" * 100
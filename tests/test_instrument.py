@@ -0,0 +1,18 @@
+import instrument
+
+def test_interrupted_rerun_is_finished_by_the_next_begin():
+    rec = instrument.Recorder()
+    rec.profile_next = True
+    instrument.begin(rec)
+    with instrument.span("before.rerun"): pass
+    # st.rerun() raised here, so end() was never called: the next rerun starts straight away
+    instrument.begin(rec)
+    assert rec.reruns == 1 and rec.run_seconds is None
+    assert rec.profile_stats and rec._profiler is None
+    assert rec.totals["before.rerun"][0] == 1
+    # a session that turned recording off gets nothing attached, even after an interrupted rerun
+    instrument.begin(None)
+    assert rec.reruns == 2
+    with instrument.span("after.off"): pass
+    assert "after.off" not in rec.totals
+    assert instrument.end() is None
@@ -0,0 +1,87 @@
+import base64
+import socketserver
+import threading
+
+import pytest
+
+import doc_cache
+import mailer
+
+class _StubSMTP(socketserver.StreamRequestHandler):
+    # Just enough of an SMTP relay that requires AUTH before MAIL; records every command
+    def reply(self, text): self.wfile.write(text.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        authed = False
+        self.reply("220 stub ESMTP")
+        for raw in self.rfile:
+            line = raw.decode('ascii').rstrip("\r\n")
+            verb = line.split(' ', 1)[0].upper()
+            server.commands.append(verb)
+            if verb == 'EHLO': self.reply("250-stub\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME")
+            elif verb == 'HELO': self.reply("250 stub")
+            elif verb == 'AUTH':
+                _, mechanism, credentials = line.split(' ', 2)
+                authed = mechanism.upper() == 'PLAIN' and base64.b64decode(credentials) == b"\0me@example.com\0secret"
+                self.reply("235 Authentication successful" if authed else "535 Bad credentials")
+            elif verb == 'MAIL': self.reply("250 OK" if authed else "530 Authentication Required")
+            elif verb == 'RCPT': self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 Go ahead")
+                for body in self.rfile:
+                    if body in (b".\r\n", b".\n"): break
+                server.messages += 1
+                self.reply("250 Queued")
+            elif verb == 'QUIT': self.reply("221 Bye"); return
+            else: self.reply("250 OK")  # NOOP, RSET
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), _StubSMTP)
+    server.daemon_threads = True
+    server.commands = []
+    server.messages = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown(); server.server_close()
+
+@pytest.fixture
+def database(tmp_path, monkeypatch, use_database):
+    monkeypatch.setattr(mailer, 'start_worker', lambda: None)  # the test delivers by hand
+    monkeypatch.setattr(mailer, '_passwords', {})
+    return use_database(tmp_path / "mail.db")
+
+def test_login_happens_before_mail(smtp_server, database, monkeypatch):
+    monkeypatch.setattr(mailer, 'SMTP_HOST', '127.0.0.1')
+    monkeypatch.setattr(mailer, 'SMTP_PORT', smtp_server.server_address[1])
+    monkeypatch.setattr(mailer, 'SMTP_STARTTLS', False)
+    msg_id = mailer.enqueue("me@example.com", "secret", "you@example.com", "Documents", "Hello", [], batch_id=1)
+    pool = mailer.SessionPool()
+    mailer._deliver(mailer._claim(float('inf')), pool)
+    for key in list(pool.sessions): pool.drop(key)
+
+    assert mailer.batch_messages(1)[0][0] == msg_id
+    assert mailer.batch_messages(1)[0][3] == 'sent'
+    assert smtp_server.messages == 1
+    commands = smtp_server.commands
+    assert commands[0] == 'EHLO'
+    assert commands.index('AUTH') < commands.index('MAIL')
+
+def test_queued_attachments_survive_cache_eviction(smtp_server, database, monkeypatch):
+    monkeypatch.setattr(mailer, 'SMTP_HOST', '127.0.0.1')
+    monkeypatch.setattr(mailer, 'SMTP_PORT', smtp_server.server_address[1])
+    monkeypatch.setattr(mailer, 'SMTP_STARTTLS', False)
+    mailer.enqueue("me@example.com", "secret", "you@example.com", "Documents", "Hello",
+                   [("CI.pdf", "application/pdf", "set:ci", b"%PDF ci")], batch_id=1)
+    # Other sessions fill the cache well past its budget before the worker gets to the message
+    for i in range(5): doc_cache.put_document(f"other:{i}", b"x" * 100, max_bytes=150)
+    assert doc_cache.get_document("other:0") is None
+    assert doc_cache.get_document("set:ci") == b"%PDF ci"
+    pool = mailer.SessionPool()
+    mailer._deliver(mailer._claim(float('inf')), pool)
+    for key in list(pool.sessions): pool.drop(key)
+    assert mailer.batch_messages(1)[0][3] == 'sent'
+    # Once sent, the attachment is an ordinary cache entry again
+    doc_cache.put_document("other:5", b"x" * 100, max_bytes=100)
+    assert doc_cache.get_document("set:ci") is None
@@ -0,0 +1,36 @@
+import json
+import sqlite3
+
+import pandas as pd
+
+import db
+
+def _baseline_db(path, orders):
+    # A database as the app left it before batch_lines: schema version 1, order lines as orders_json
+    conn = sqlite3.connect(path, isolation_level=None)
+    c = conn.cursor()
+    db._migration_1(c)
+    c.execute("CREATE TABLE schema_migrations (version INTEGER PRIMARY KEY, applied_at TEXT)")
+    c.execute("INSERT INTO schema_migrations VALUES (1, '2025-01-01T00:00:00')")
+    data = {'inv_number': '202501011', 'inv_date': '2025-01-01', 'orders_json': orders.to_json(orient='split')}
+    c.execute("INSERT INTO batches (batch_name, status, created_at, updated_at, data) VALUES ('Old', 'Active', '', '', ?)", (json.dumps(data),))
+    conn.close()
+
+def test_migration_keeps_text_columns_as_text(tmp_path, use_database):
+    path = str(tmp_path / "old.db")
+    orders = pd.DataFrame({
+        'product_id': ['P1', 'P2'], 'HTS Code': ['0901', '0901.21.00.20'], 'Weight (lbs)': [0.75, 2.0],
+        'country_of_origin': ['CA', 'CA'], 'FDA Code': ['31ADT01', '0123'], 'Quantity': [3, 12],
+        'Transfer Total': [30.0, 96.5], 'Product Name': ['Espresso', 'Decaf'], 'Description': ['Espresso 12oz', '1e5'],
+        'Variant code / SKU': ['00123', '4567'], 'Transfer Price (Unit)': [10.0, 8.04],
+    })
+    _baseline_db(path, orders)
+    use_database(path)
+    lines = db.get_batch_lines(1)
+    assert list(lines['HTS Code']) == ['0901', '0901.21.00.20']
+    assert list(lines['Variant code / SKU']) == ['00123', '4567']
+    assert list(lines['FDA Code']) == ['31ADT01', '0123']
+    assert list(lines['Description']) == ['Espresso 12oz', '1e5']
+    assert list(lines['Quantity']) == [3, 12]
+    assert list(lines['Transfer Price (Unit)']) == [10.0, 8.04]
+    assert db.get_batch(1)['data']['lines_digest'] is not None
@@ -0,0 +1,93 @@
+import functools
+
+from fpdf.enums import MethodReturnValue
+
+# --- Shared Text Measurement ---
+# Row heights in the document tables come from counting how many lines each cell wraps to. This
+# module does that from the core fonts' glyph-width tables, memoizing word widths per font and
+# whole-cell line counts per (font, size, width, text). Descriptions repeat heavily across
+# orders and batches, so most lookups are cache hits. Results match pdf.get_string_width exactly.
+# It also keeps fpdf2's own line breaks of each cell text, so a repeated text is only wrapped once.
+
+class FontMetrics:
+    # Glyph widths for one core font (in 1/1000 em), shared by every size of that font
+    def __init__(self, font):
+        self.fontkey = font.fontkey
+        self.cw = font.cw
+        self.space_units = self.cw[' ']
+        self.word_units = functools.lru_cache(maxsize=65536)(self._word_units)
+        self.line_count = functools.lru_cache(maxsize=16384)(self._line_count)
+        self.wrapped = {}  # (text, size, width, cell margin) -> lines, as multi_cell breaks them
+
+    def _word_units(self, word):
+        return sum(map(self.cw.__getitem__, word))
+
+    def _line_count(self, text, size_pt, k, width):
+        # Same wrapping rule the tables have always used: greedy, word + trailing space
+        if not text: return 1
+        lines = 0
+        for para in text.split('\n'):
+            if not para: lines += 1; continue
+            curr_w = 0; lines_para = 1
+            for word in para.split(' '):
+                word_w = (self.word_units(word) + self.space_units) * size_pt * 0.001 / k
+                if curr_w + word_w > width: lines_para += 1; curr_w = word_w
+                else: curr_w += word_w
+            lines += lines_para
+        return lines
+
+_font_metrics = {}
+
+def _metrics_for(pdf):
+    # Only plain core fonts have fixed, shareable width tables; anything else is measured by fpdf2
+    font = pdf.current_font
+    if getattr(font, 'type', None) != 'core' or pdf.char_spacing != 0 or pdf.font_stretching != 100:
+        return None
+    metrics = _font_metrics.get(font.fontkey)
+    if metrics is None:
+        metrics = _font_metrics[font.fontkey] = FontMetrics(font)
+    return metrics
+
+def _fallback_line_count(pdf, text, width):
+    if not text: return 1
+    lines = 0
+    for para in text.split('\n'):
+        if not para: lines += 1; continue
+        curr_w = 0; lines_para = 1
+        for word in para.split(' '):
+            word_w = pdf.get_string_width(word + " ")
+            if curr_w + word_w > width: lines_para += 1; curr_w = word_w
+            else: curr_w += word_w
+        lines += lines_para
+    return lines
+
+def line_count(pdf, text, width):
+    # Number of lines `text` wraps to in a cell `width` wide, in the pdf's current font
+    text = str(text)
+    metrics = _metrics_for(pdf)
+    if metrics is not None:
+        try: return metrics.line_count(text, pdf.font_size_pt, pdf.k, width)
+        except KeyError: pass  # glyph outside the core font: let fpdf2 raise its usual error
+    return _fallback_line_count(pdf, text, width)
+
+def wrapped_lines(pdf, text, width):
+    # The lines multi_cell would break `text` into in a cell `width` wide, in the pdf's current font
+    # (left, centre and right alignment all break the same way). None for fonts that aren't shared.
+    metrics = _metrics_for(pdf)
+    if metrics is None: return None
+    key = (text, pdf.font_size_pt, width, pdf.c_margin)
+    lines = metrics.wrapped.get(key)
+    if lines is None:
+        if len(metrics.wrapped) >= 16384: metrics.wrapped.clear()
+        lines = metrics.wrapped[key] = tuple(pdf.multi_cell(width, 1, text, 0, 'L', dry_run=True, output=MethodReturnValue.LINES))
+    return lines
+
+def column_line_counts(pdf, texts, width):
+    # Line counts for a whole column; each distinct text is measured once
+    counts = {}
+    out = []
+    for text in texts:
+        n = counts.get(text)
+        if n is None: n = counts[text] = line_count(pdf, text, width)
+        out.append(n)
+    return out